@@ -2,15 +2,21 @@ import threading
 import time
 import os
 import socket
+import collections
 import requests
 
-# Initial Tcp connection setting
-tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-SensorIP = '192.168.1.186'
-SensorPort = 25555
-Frequency = 0.5
-api_address = "http://127.0.0.1:5000/api/add_data"
+# Sensors to read, by sensor ID (one per infusion line)
+SENSORS = {
+    'default': ('192.168.1.186', 25555),
+}
+Frequency = 0.5  # Expected sensor rate, the stream is read as fast as the sensor sends
+api_address = "http://127.0.0.1:5000/api/add_data_batch"
+BatchSize = 50  # Samples posted per request
+FlushInterval = 2.0  # Seconds a sample may wait before being posted
+BufferSize = 100000  # Samples kept while the API is unreachable, the oldest are dropped beyond
+RetryDelay = 1.0  # Seconds, doubled after every failed post
+MaxRetryDelay = 30.0  # Seconds
+ReconnectDelay = 5.0  # Seconds between attempts to reconnect to a sensor
 
 ## Check connection to sensors
 def check_socket_connection(tcp_socket, host, port):
@@ -23,36 +29,175 @@ def check_socket_connection(tcp_socket, host, port):
         print(f"Socket error: {e}")
         return False
 
+## Incremental parser for the sensor stream
+class SensorStreamParser:
+    """
+    Extracts the readings from the sensor TCP stream, whatever the read boundaries.
+
+    A record is a header without spaces, a space, the temperature line and the resistance
+    line, each prefixed with a one-letter tag and terminated by CRLF (e.g. "#1 T23.50\r\nR456.7\r\n").
+    Reads go into a reusable buffer; every complete record is extracted and a partial record
+    at the end is kept for the next read, so split and coalesced packets lose nothing.
+    """
+
+    def __init__(self, chunk_size=4096):
+        self.chunk = bytearray(chunk_size)
+        self.view = memoryview(self.chunk)
+        self.buffer = bytearray()
+        self.skipped = 0
+
+    def read(self, tcp_socket):
+        received = tcp_socket.recv_into(self.chunk)
+        if not received:
+            raise ConnectionError("The sensor closed the connection")
+        return self.feed(self.view[:received])
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        samples = []
+        position = 0
+        while True:
+            space = buffer.find(b' ', position)
+            if space < 0:
+                break
+            temperature_end = buffer.find(b'\r\n', space + 1)
+            if temperature_end < 0:
+                break
+            resistance_end = buffer.find(b'\r\n', temperature_end + 2)
+            if resistance_end < 0:
+                break
+            try:
+                temperature = float(buffer[space + 2:temperature_end])
+                resistance = float(buffer[temperature_end + 3:resistance_end])
+                samples.append({"temperature": temperature, "resistance": resistance})
+                position = resistance_end + 2
+            except ValueError:
+                # Not a record (e.g. we connected mid-record), resynchronize on the next line
+                self.skipped += 1
+                position = temperature_end + 2
+        del buffer[:position]
+        return samples
+
 ## Connect to Sensor Data
-def ReadSensor(tcp_socket):
+def ReadSensor(tcp_socket, parser):
     try:
-        tcp_socket.settimeout(5.0)  # Set a timeout of 5 seconds
-        sensorData = tcp_socket.recv(1024)
-        
-        decoded_data = sensorData.decode('utf-8').split(' ')
-        data = decoded_data[1].split("\r\n") 
-        temperature = float(data[0][1:])
-        resistance = float(data[1][1:])
-
-        return {"temperature": temperature, "resistance": resistance}
+        tcp_socket.settimeout(max(5.0, 2/Frequency))  # Set a timeout of 5 seconds, or two sensor periods if longer
+        return parser.read(tcp_socket)
     except socket.timeout:
         print("Timeout error: The read operation timed out")
-        return None
+        return []
+
+## Buffer the samples of one sensor and post them to the api in batches
+class SampleUploader:
+    """
+    Decouples reading a sensor from posting its samples to the API.
 
+    The reader only appends to a bounded in-memory buffer. A separate thread posts the buffer
+    in batches over a persistent keep-alive session, and keeps the samples (retrying with
+    backoff) while the API is slow or down, so they are replayed once it is back. A batch
+    the API rejects (a client error, which would fail again on retry) is split in halves
+    until only the rejected samples are dropped.
+    """
 
-# Check the connection before reading data
-if check_socket_connection(tcp_socket, SensorIP, SensorPort):
+    def __init__(self, sensor_id):
+        self.sensor_id = sensor_id
+        self.buffer = collections.deque()
+        self.dropped = 0
+        self.condition = threading.Condition()
+        self.session = requests.Session()
+        self.thread = threading.Thread(target=self.upload_loop, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, sample):
+        with self.condition:
+            if len(self.buffer) >= BufferSize:
+                # Keep the most recent samples if the outage outlasts the buffer
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append(sample)
+            if len(self.buffer) >= BatchSize:
+                self.condition.notify()
+
+    def upload_loop(self):
+        delay = RetryDelay
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.buffer) >= BatchSize, timeout=FlushInterval)
+                batch = [self.buffer.popleft() for _ in range(min(BatchSize, len(self.buffer)))]
+            if not batch:
+                continue
+            unsent = self.post(batch)
+            if not unsent:
+                delay = RetryDelay
+                continue
+            # Put the unsent samples back in front of the newer ones and retry later
+            with self.condition:
+                self.buffer.extendleft(reversed(unsent))
+                while len(self.buffer) > BufferSize:
+                    self.buffer.popleft()
+                    self.dropped += 1
+                print(f"{len(self.buffer)} samples of sensor {self.sensor_id} buffered, {self.dropped} dropped")
+            time.sleep(delay)
+            delay = min(delay * 2, MaxRetryDelay)
+
+    def post(self, batch):
+        # Returns the samples left to post: none once the batch is added or rejected
+        try:
+            response = self.session.post(api_address, json={"sensor_id": self.sensor_id, "samples": batch}, timeout=10)
+        except requests.RequestException as e:
+            print(f"Failed to post data of sensor {self.sensor_id} to the API. Error: {e}")
+            return batch
+        if response.ok:
+            return []
+        if response.status_code >= 500:
+            print(f"Failed to post data of sensor {self.sensor_id} to the API. Error: {response.status_code}")
+            return batch
+        if len(batch) == 1:
+            # Client errors would fail again on retry, so the rejected sample is dropped
+            with self.condition:
+                self.dropped += 1
+            print(f"Sample {batch[0]} of sensor {self.sensor_id} rejected by the API (error {response.status_code}), "
+                  f"{self.dropped} dropped")
+            return []
+        # The API rejects a whole batch for one invalid sample, so post the halves apart
+        middle = len(batch) // 2
+        unsent = self.post(batch[:middle])
+        if unsent:
+            # Keep the order: nothing after a server error is posted before it
+            return unsent + batch[middle:]
+        return self.post(batch[middle:])
+
+## Read one sensor as fast as it sends, independent of the api
+def CollectSensor(sensor_id, host, port):
+    uploader = SampleUploader(sensor_id)
     while True:
-        time.sleep(1/Frequency)
-        data = ReadSensor(tcp_socket)
-        if data:
-            # posting the data to the api
-            response = requests.post(api_address, json=data)
-            if not response.ok:
-                print(f"Failed to post data to the API. Error: {response.status_code}")
+        # Initial Tcp connection setting
+        tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        parser = SensorStreamParser()
+        # Check the connection before reading data
+        if check_socket_connection(tcp_socket, host, port):
+            try:
+                while True:
+                    samples = ReadSensor(tcp_socket, parser)
+                    timestamp = time.time()
+                    for data in samples:
+                        data["timestamp"] = timestamp
+                        uploader.put(data)
+            except (ConnectionError, OSError) as e:
+                print(f"Connection to the sensor {sensor_id} lost: {e}")
         else:
-            print("Unable to read data from the sensor.")
-else:
-    print("Unable to connect to the sensor.")
-    
-  
\ No newline at end of file
+            print(f"Unable to connect to the sensor {sensor_id}.")
+        tcp_socket.close()
+        time.sleep(ReconnectDelay)
+
+
+# One collector thread per sensor, only when run as a script so the parser can be imported
+if __name__ == '__main__':
+    threads = [threading.Thread(target=CollectSensor, args=(sensor_id, host, port))
+               for sensor_id, (host, port) in SENSORS.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,66 @@
+import argparse
+import random
+import socket
+import threading
+import time
+
+from app import SensorStreamParser
+from fake_sensor import make_record, serve
+
+# Checks SensorStreamParser end to end: the fake sensor sends records split and coalesced at
+# random boundaries over a real socket, and every record must be parsed once, in order.
+# Exits non-zero on any lost, duplicated or corrupted record and reports the throughput.
+
+def expected_sample(index):
+    temperature, resistance = make_record(index).decode().split(' ', 1)[1].split('\r\n')[:2]
+    return {"temperature": float(temperature[1:]), "resistance": float(resistance[1:])}
+
+def connect(host, port, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except ConnectionRefusedError:
+            # The fake sensor is still starting
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+def check(host, port, count):
+    tcp_socket = connect(host, port)
+    parser = SensorStreamParser()
+    samples = []
+    start = time.perf_counter()
+    try:
+        while len(samples) < count:
+            samples += parser.read(tcp_socket)
+    except ConnectionError:
+        pass
+    elapsed = time.perf_counter() - start
+    tcp_socket.close()
+    print(f"Parsed {len(samples)} of {count} records in {elapsed:.2f} s ({len(samples) / elapsed:.0f} records/s), "
+          f"{parser.skipped} skipped")
+    # Checked after the timing, so the throughput is the one of the parser and the socket
+    errors = 0
+    for index, sample in enumerate(samples):
+        if sample != expected_sample(index):
+            errors += 1
+            if errors <= 10:
+                print(f"Record {index}: got {sample}, expected {expected_sample(index)}")
+    if len(samples) != count or errors or parser.skipped:
+        raise SystemExit(f"{errors} corrupted records, {count - len(samples)} missing, {parser.skipped} skipped")
+    print("All records parsed in order")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the sensor stream parser against the fuzzed fake sensor.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25556)
+    parser.add_argument('--count', type=int, default=200000, help="Records sent")
+    parser.add_argument('--seed', type=int, help="Seed of the random split points")
+    args = parser.parse_args()
+    random.seed(args.seed)
+    # The fake sensor sends as fast as possible, from its own thread
+    thread = threading.Thread(target=serve, args=(args.host, args.port, 0, args.count, True))
+    thread.daemon = True
+    thread.start()
+    check(args.host, args.port, args.count)
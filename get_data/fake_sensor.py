@@ -0,0 +1,53 @@
+import argparse
+import math
+import random
+import socket
+import time
+
+# Serves synthetic Optimold-style readings over TCP, to run app.py without the sensor.
+# With --fuzz, records are split and coalesced at random boundaries like a real network would.
+
+def make_record(index):
+    temperature = 20 + 10 * (1 - math.exp(-index / 2000))
+    resistance = 100 + max(0, index - 500) ** 1.2
+    return f"#716 T{temperature:.2f}\r\nR{resistance:.1f}\r\n".encode()
+
+def serve(host, port, rate, count, fuzz):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    print(f"Fake sensor listening on {host}:{port} ({rate} records/s)")
+    while True:
+        connection, address = server.accept()
+        print(f"Sensor client connected from {address}")
+        pending = bytearray()
+        start = time.monotonic()
+        try:
+            for index in range(count):
+                pending += make_record(index)
+                if fuzz:
+                    # Send a random prefix, keep the rest for a later write
+                    cut = random.randint(0, len(pending))
+                    connection.sendall(pending[:cut])
+                    del pending[:cut]
+                else:
+                    connection.sendall(pending)
+                    pending.clear()
+                if rate:
+                    time.sleep(max(0.0, start + (index + 1) / rate - time.monotonic()))
+            connection.sendall(pending)
+            print(f"Sent {count} records in {time.monotonic() - start:.2f} s")
+        except OSError as e:
+            print(f"Sensor client disconnected: {e}")
+        connection.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Optimold sensor for testing the data collection module.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=25555)
+    parser.add_argument('--rate', type=float, default=0.5, help="Records per second, 0 for as fast as possible")
+    parser.add_argument('--count', type=int, default=10**9, help="Records sent per connection")
+    parser.add_argument('--fuzz', action='store_true', help="Split and coalesce records at random boundaries")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.rate, args.count, args.fuzz)
@@ -0,0 +1,348 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+HISTORY_SIZES = (1000, 10000, 100000, 1000000)
+QUICK_HISTORY_SIZES = (1000, 10000, 100000)
+CONSUMER_COUNTS = (1, 5, 10, 25, 50)
+TIMED_SAMPLES = 2000  # Samples timed at every history size
+TIMED_REQUESTS = 20  # Requests timed at every history size
+FRAME_SIZE = (720, 1280)  # Height, width of the synthetic camera frames
+CAMERA_FPS = 25  # Frames per second produced by the fake camera
+STREAM_SECONDS = 3.0  # Duration of every video run
+REGRESSION_THRESHOLD = 0.10  # Relative change reported as a regression
+
+
+def synthetic_resistance(count, offset=0):
+    """
+    Generates a synthetic cure curve: a noisy sigmoid over about three hours at 0.5 Hz.
+
+    Args:
+        count (int): The number of samples.
+        offset (int): The index of the first sample.
+
+    Returns:
+        numpy.ndarray: The resistance values.
+    """
+    t = np.arange(offset, offset + count)
+    rng = np.random.default_rng(offset)
+    return 100 + 5000 / (1 + np.exp(-(t % 5400 - 2700) / 270)) + rng.normal(0, 20, count)
+
+
+def fill(sensor_data, count):
+    """
+    Appends synthetic samples to a pipeline.
+
+    Args:
+        sensor_data (Sensor_Data): The pipeline.
+        count (int): The number of samples to append.
+    """
+    start = sensor_data.get_sample_count()
+    now = time.time()
+    resistance = synthetic_resistance(count, start).tolist()
+    with sensor_data.lock:
+        for i, value in enumerate(resistance):
+            sensor_data.append_sample(25.0, value, now + (start + i) * 2)
+
+
+def bench_ingest(main, sizes):
+    """
+    Measures the samples per second through Sensor_Data and /api/add_data against the history size.
+
+    Args:
+        main (module): The API module.
+        sizes (tuple): The history sizes to measure at.
+
+    Returns:
+        dict: The metrics by history size.
+    """
+    results = {}
+    client = main.app.test_client()
+    for size in sizes:
+        sensor_id = f'benchmark-ingest-{size}'
+        sensor_data = main.sensors.get(sensor_id)
+        fill(sensor_data, size)
+        start = time.perf_counter()
+        fill(sensor_data, TIMED_SAMPLES)
+        direct = TIMED_SAMPLES / (time.perf_counter() - start)
+        values = synthetic_resistance(TIMED_SAMPLES // 10).tolist()
+        start = time.perf_counter()
+        for value in values:
+            client.post('/api/add_data', json={'sensor_id': sensor_id, 'temperature': 25.0, 'resistance': value})
+        http = len(values) / (time.perf_counter() - start)
+        results[str(size)] = {'sensor_data_samples_per_s': direct, 'add_data_requests_per_s': http}
+        print(f"ingest at {size} samples: {direct:.0f} samples/s direct, {http:.0f} requests/s over HTTP")
+    return results
+
+
+def bench_get_data(main, sizes):
+    """
+    Measures the /api/get_data response time and payload size against the history length.
+
+    The sensor the thermal camera watches is measured too: as served without a thermal
+    analysis, and with the (all null) thermal statistics forced by 'thermal=1'.
+
+    Args:
+        main (module): The API module.
+        sizes (tuple): The history sizes to measure at.
+
+    Returns:
+        dict: The metrics by history size.
+    """
+    results = {}
+    client = main.app.test_client()
+
+    def time_full(query, repeats):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            response = client.get(query)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000, len(response.data)
+
+    for size in sizes:
+        sensor_id = f'benchmark-get-data-{size}'
+        fill(main.sensors.get(sensor_id), size)
+        # Fewer repetitions for the largest histories, which take seconds each
+        repeats = max(3, min(TIMED_REQUESTS, 10000000 // (size * 10)))
+        full_ms, payload = time_full(f'/api/get_data?sensor_id={sensor_id}', repeats)
+        delta_timings = []
+        for _ in range(TIMED_REQUESTS):
+            start = time.perf_counter()
+            client.get(f'/api/get_data?sensor_id={sensor_id}&since={size - 1}')
+            delta_timings.append(time.perf_counter() - start)
+        thermal_sensor = main.sensors.get(main.THERMAL_SENSOR_ID)
+        thermal_sensor.reset_data()
+        fill(thermal_sensor, size)
+        default_ms, default_payload = time_full(f'/api/get_data?sensor_id={main.THERMAL_SENSOR_ID}', repeats)
+        thermal_ms, thermal_payload = time_full(f'/api/get_data?sensor_id={main.THERMAL_SENSOR_ID}&thermal=1', repeats)
+        results[str(size)] = {
+            'full_ms': full_ms,
+            'full_bytes': payload,
+            'delta_ms': statistics.median(delta_timings) * 1000,
+            'default_full_ms': default_ms,
+            'default_full_bytes': default_payload,
+            'thermal_full_ms': thermal_ms,
+            'thermal_full_bytes': thermal_payload,
+        }
+        print(f"get_data at {size} samples: {full_ms:.1f} ms, {payload} bytes full, "
+              f"{results[str(size)]['delta_ms']:.2f} ms delta; thermal sensor {default_ms:.1f} ms, "
+              f"{default_payload} bytes, {thermal_ms:.1f} ms, {thermal_payload} bytes with thermal=1")
+    return results
+
+
+def make_fake_camera(main):
+    """
+    Builds a camera producing synthetic frames, with the encoding of VideoCamera.
+
+    Args:
+        main (module): The API module.
+
+    Returns:
+        VideoCamera: The fake camera, already producing frames.
+    """
+    import cv2
+
+    class FakeCamera(main.VideoCamera):
+        """
+        A VideoCamera producing moving synthetic frames at CAMERA_FPS instead of reading a stream.
+        """
+
+        def __init__(self):
+            self.rtsp_link = 'synthetic'
+            self.decode_fps = CAMERA_FPS
+            self.name = 'synthetic'
+            self.video = cv2.VideoCapture()
+            rng = np.random.default_rng(0)
+            # Noise keeps the JPEG size realistic, a moving bar makes every frame different
+            self.background = rng.integers(0, 64, FRAME_SIZE + (3,), dtype=np.uint8)
+            self.frame = self.background.copy()
+            self.grabbed = True
+            self.sequence = 1
+            self.encoded = None
+            self.encoded_sequence = 0
+            self.lock = threading.Lock()
+            self.thread = threading.Thread(target=self.update_frame, args=())
+            self.thread.daemon = True
+            self.thread.start()
+
+        def update_frame(self):
+            interval = 1 / self.decode_fps
+            while True:
+                frame = self.background.copy()
+                column = (self.sequence * 16) % FRAME_SIZE[1]
+                frame[:, column:column + 32] = 255
+                self.frame = frame
+                self.sequence += 1
+                time.sleep(interval)
+
+    return FakeCamera()
+
+
+def bench_encode(main, consumer_counts):
+    """
+    Measures the JPEG encode throughput and the frames delivered to 1 to 50 concurrent viewers.
+
+    Args:
+        main (module): The API module.
+        consumer_counts (tuple): The numbers of concurrent viewers to measure with.
+
+    Returns:
+        dict: The raw encode throughput, and the stream metrics by number of viewers.
+    """
+    camera = make_fake_camera(main)
+    frame = camera.frame
+    import cv2
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < STREAM_SECONDS:
+        cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+        count += 1
+    results = {'raw': {'encodes_per_s': count / (time.perf_counter() - start)}}
+    print(f"raw JPEG encode: {results['raw']['encodes_per_s']:.1f} frames/s")
+
+    for consumers in consumer_counts:
+        broadcaster = main.FrameBroadcaster(camera, fps=main.STREAM_FPS)
+        delivered = [0] * consumers
+        stop = threading.Event()
+
+        def consume(slot):
+            frames = broadcaster.frames(main.STREAM_FPS)
+            for _ in frames:
+                delivered[slot] += 1
+                if stop.is_set():
+                    break
+            frames.close()
+
+        threads = [threading.Thread(target=consume, args=(slot,), daemon=True) for slot in range(consumers)]
+        encoded_before = broadcaster.sequence
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(STREAM_SECONDS)
+        stop.set()
+        elapsed = time.perf_counter() - start
+        encoded = broadcaster.sequence - encoded_before
+        for thread in threads:
+            thread.join(timeout=2)
+        per_consumer = sum(delivered) / consumers / elapsed
+        results[str(consumers)] = {
+            'encoded_frames_per_s': encoded / elapsed,
+            'frames_per_consumer_per_s': per_consumer,
+            'delivered_frames_per_s': sum(delivered) / elapsed,
+        }
+        print(f"{consumers} viewers: {encoded / elapsed:.1f} encodes/s, {per_consumer:.1f} frames/s per viewer")
+    return results
+
+
+def git_revision():
+    """
+    Returns the git revision of the working tree, if available.
+
+    Returns:
+        str: The commit hash, with '-dirty' if there are local changes, or None.
+    """
+    try:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        revision = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=directory,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        return revision or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous, current):
+    """
+    Prints the change of every metric against a previous run and lists the regressions.
+
+    Metrics ending in '_per_s' are better higher, the others (times and sizes) better lower.
+
+    Args:
+        previous (dict): The results of the previous run.
+        current (dict): The results of this run.
+
+    Returns:
+        list: The (benchmark, parameter, metric, change) regressions beyond REGRESSION_THRESHOLD.
+    """
+    regressions = []
+    print(f"\nCompared to {previous.get('revision')} ({previous.get('date')}):")
+    for benchmark, parameters in current['results'].items():
+        for parameter, metrics in parameters.items():
+            for metric, value in metrics.items():
+                old = previous['results'].get(benchmark, {}).get(parameter, {}).get(metric)
+                if not old:
+                    continue
+                change = (value - old) / old
+                worse = -change if metric.endswith('_per_s') else change
+                flag = '  REGRESSION' if worse > REGRESSION_THRESHOLD else ''
+                print(f"  {benchmark} {parameter} {metric}: {old:.4g} -> {value:.4g} ({change:+.1%}){flag}")
+                if flag:
+                    regressions.append((benchmark, parameter, metric, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ingest, get_data serialization and video encoding offline with synthetic data.")
+    parser.add_argument('--quick', action='store_true', help="Skip the 1M sample history")
+    parser.add_argument('--only', choices=('ingest', 'get_data', 'encode'), nargs='+',
+                        help="Only run these benchmarks")
+    parser.add_argument('--output', help="Where to save the results (default: benchmark-<date>.json)")
+    parser.add_argument('--compare', help="Results of a previous run to compare with")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output or f"benchmark-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    previous = None
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+
+    # Import the API from a scratch directory so its run log is a throwaway one
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix='benchmark-'))
+    import main as api
+    api.run_log.close()
+    api.run_log = None
+    api.sensors.run_log = None
+    # No thermal analysis competing with the benchmarks
+    api.thermal_monitor.set_rate(0)
+
+    sizes = QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES
+    benchmarks = args.only or ('ingest', 'get_data', 'encode')
+    results = {}
+    if 'ingest' in benchmarks:
+        results['ingest'] = bench_ingest(api, sizes)
+    if 'get_data' in benchmarks:
+        results['get_data'] = bench_get_data(api, sizes)
+    if 'encode' in benchmarks:
+        results['encode'] = bench_encode(api, CONSUMER_COUNTS)
+
+    current = {
+        'revision': git_revision(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': f"{platform.machine()} {os.cpu_count()} cpus",
+        'results': results,
+    }
+    with open(output, 'w') as file:
+        json.dump(current, file, indent=2)
+    print(f"\nResults saved to {output}")
+    if previous is not None:
+        regressions = compare(previous, current)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} metrics regressed by more than {REGRESSION_THRESHOLD:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import os
+import struct
+import sys
+import time
+
+from multiprocessing import shared_memory, resource_tracker
+
+
+RING_SLOTS = 4  # Frames kept in the ring, a reader has RING_SLOTS - 1 frame periods to copy one
+MAX_FRAME_BYTES = 4 * 1024 * 1024  # Largest encoded frame a slot holds
+DEMAND_TIMEOUT = 2.0  # Seconds without a reader after which frames are no longer encoded
+RECONNECT_DELAY = 1  # Seconds, doubled after every failed reconnect
+MAX_RECONNECT_DELAY = 30  # Seconds
+STOP_POLL_INTERVAL = 0.1  # Seconds between checks of the stop flag while waiting to reconnect
+
+# Capture states published in the ring header
+CONNECTING, STREAMING, RECONNECTING = 0, 1, 2
+
+# Ring header: sequence, frames retrieved, read failures, stop flag, capture state (uint64), last read, heartbeat (float64)
+HEADER = struct.Struct('<QQQQQdd')
+# Slot header: sequence of the frame in the slot (0 while being written), length (uint64), encode time (float64)
+SLOT_HEADER = struct.Struct('<QQd')
+
+
+class SharedFrameRing:
+    """
+    A ring of encoded frames in shared memory, written by one camera process and read by the API.
+
+    The writer copies each frame into the next slot and then publishes its sequence number.
+    Every slot carries the sequence of the frame it holds, cleared while the slot is being
+    written, so a reader checks it before and after copying a frame and never returns a torn
+    one (a seqlock). Readers never block the writer and nothing is pickled or piped.
+
+    The header also carries the writer's counters and capture state, a heartbeat, the time of
+    the last read (the writer only encodes while someone reads) and a stop flag.
+
+    Attributes:
+        shm (multiprocessing.shared_memory.SharedMemory): The shared memory block.
+        buffer (memoryview): The contents of the block.
+        slots (int): The number of frame slots.
+        max_frame_bytes (int): The size of every slot.
+        slot_size (int): The size of a slot including its header.
+
+    Methods:
+        publish(sequence, frame, encode_seconds): Writes a frame and makes it the latest one.
+        latest_sequence(): Returns the sequence number of the latest frame.
+        read_latest(): Returns a copy of the latest frame.
+        read_header(): Returns the fields of the header.
+        update_header(**fields): Rewrites fields of the header.
+        close(): Detaches from the shared memory.
+        unlink(): Frees the shared memory (the creator does it once every process closed it).
+    """
+
+    FIELDS = ('sequence', 'frames_retrieved', 'read_failures', 'stop', 'state', 'last_read', 'heartbeat')
+
+    def __init__(self, name=None, slots=RING_SLOTS, max_frame_bytes=MAX_FRAME_BYTES):
+        self.slots = slots
+        self.max_frame_bytes = max_frame_bytes
+        self.slot_size = SLOT_HEADER.size + max_frame_bytes
+        size = HEADER.size + slots * self.slot_size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            HEADER.pack_into(self.shm.buf, 0, 0, 0, 0, 0, CONNECTING, 0.0, 0.0)
+        else:
+            self.shm = attach(name)
+        self.buffer = self.shm.buf
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, sequence, frame, encode_seconds):
+        """
+        Writes a frame to its slot and makes it the latest one.
+
+        Args:
+            sequence (int): The sequence number of the frame, starting at 1.
+            frame (bytes): The encoded frame.
+            encode_seconds (float): The time it took to encode the frame.
+
+        Returns:
+            bool: False if the frame is larger than a slot and was dropped.
+        """
+        if len(frame) > self.max_frame_bytes:
+            return False
+        offset = HEADER.size + (sequence % self.slots) * self.slot_size
+        start = offset + SLOT_HEADER.size
+        SLOT_HEADER.pack_into(self.buffer, offset, 0, len(frame), encode_seconds)
+        self.buffer[start:start + len(frame)] = frame
+        SLOT_HEADER.pack_into(self.buffer, offset, sequence, len(frame), encode_seconds)
+        struct.pack_into('<Q', self.buffer, 0, sequence)
+        return True
+
+    def latest_sequence(self):
+        """
+        Returns the sequence number of the latest frame.
+
+        Returns:
+            int: The sequence number, 0 before the first frame.
+        """
+        return struct.unpack_from('<Q', self.buffer, 0)[0]
+
+    def read_latest(self):
+        """
+        Returns a copy of the latest frame.
+
+        Returns:
+            tuple: The sequence number, the encoded frame and its encode time, or (0, None, 0.0)
+            if no frame was published (or it was overwritten while being copied, which needs the
+            writer to go around the whole ring meanwhile).
+        """
+        sequence = self.latest_sequence()
+        if not sequence:
+            return 0, None, 0.0
+        offset = HEADER.size + (sequence % self.slots) * self.slot_size
+        start = offset + SLOT_HEADER.size
+        slot_sequence, length, encode_seconds = SLOT_HEADER.unpack_from(self.buffer, offset)
+        if slot_sequence != sequence:
+            return 0, None, 0.0
+        frame = bytes(self.buffer[start:start + length])
+        if SLOT_HEADER.unpack_from(self.buffer, offset)[0] != sequence:
+            return 0, None, 0.0
+        return sequence, frame, encode_seconds
+
+    def read_header(self):
+        """
+        Returns the fields of the header.
+
+        Returns:
+            dict: The header fields by name.
+        """
+        return dict(zip(self.FIELDS, HEADER.unpack_from(self.buffer, 0)))
+
+    def update_header(self, **fields):
+        """
+        Rewrites fields of the header.
+
+        Each field is a single aligned 8-byte store, so fields written by different processes
+        (the last read by the API, the counters by the camera process) never clobber each other.
+
+        Args:
+            **fields: The new values by field name.
+        """
+        for name, value in fields.items():
+            index = self.FIELDS.index(name)
+            struct.pack_into('<d' if index >= 5 else '<Q', self.buffer, index * 8, value)
+
+    def close(self):
+        """
+        Detaches from the shared memory.
+        """
+        self.buffer.release()
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory.
+        """
+        self.shm.unlink()
+
+
+def attach(name):
+    """
+    Attaches to an existing shared memory block without taking ownership of it.
+
+    Args:
+        name (str): The name of the block.
+
+    Returns:
+        multiprocessing.shared_memory.SharedMemory: The block.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with this process's resource
+        # tracker, which would free it when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def wait_for_stop(ring, parent, seconds):
+    """
+    Sleeps, waking up early if the worker is asked to stop or the API exits.
+
+    Args:
+        ring (SharedFrameRing): The ring of the worker.
+        parent (int): The PID of the API process.
+        seconds (float): The time to sleep.
+
+    Returns:
+        bool: True if the worker should stop.
+    """
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if ring.read_header()['stop'] or os.getppid() != parent:
+            return True
+        time.sleep(min(STOP_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+    return False
+
+
+def capture(rtsp_link, ring, decode_fps, quality):
+    """
+    Reads a camera and publishes its frames to the ring until asked to stop or the API exits.
+
+    Every frame the stream delivers is grabbed so the stream never lags behind; up to
+    `decode_fps` frames per second are retrieved and encoded, and only while the API reads
+    frames. A dropped stream is reopened with exponential backoff. The counters and sequence
+    continue from the ring header, so a restarted worker does not reset them.
+
+    Args:
+        rtsp_link (str): The RTSP link to the video stream.
+        ring (SharedFrameRing): The ring the frames are published to.
+        decode_fps (float): The maximum number of frames retrieved per second.
+        quality (int): The JPEG quality.
+    """
+    import cv2
+
+    parent = os.getppid()
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    interval = 1 / decode_fps
+    next_retrieve = time.monotonic()
+    delay = RECONNECT_DELAY
+    header = ring.read_header()
+    sequence = header['sequence']
+    frames_retrieved = header['frames_retrieved']
+    read_failures = header['read_failures']
+    video = cv2.VideoCapture(rtsp_link)
+    while True:
+        header = ring.read_header()
+        if header['stop'] or os.getppid() != parent:
+            break
+        ring.update_header(heartbeat=time.time())
+        if not video.grab():
+            read_failures += 1
+            ring.update_header(read_failures=read_failures, state=RECONNECTING)
+            print(f"Camera stream dropped, reconnecting in {delay} s", file=sys.stderr)
+            video.release()
+            if wait_for_stop(ring, parent, delay):
+                break
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            video = cv2.VideoCapture(rtsp_link)
+            continue
+        if header['state'] != STREAMING:
+            ring.update_header(state=STREAMING)
+        delay = RECONNECT_DELAY
+        now = time.monotonic()
+        # Frames nobody reads are grabbed but neither retrieved nor encoded
+        if now >= next_retrieve and time.time() - header['last_read'] < DEMAND_TIMEOUT:
+            retrieved, frame = video.retrieve()
+            if retrieved:
+                start = time.perf_counter()
+                encoded = cv2.imencode('.jpg', frame, encode_param)[1].reshape(-1)
+                encode_seconds = time.perf_counter() - start
+                frames_retrieved += 1
+                sequence += 1
+                if not ring.publish(sequence, encoded, encode_seconds):
+                    print(f"Dropped a {len(encoded)} bytes frame, larger than the ring slots", file=sys.stderr)
+                ring.update_header(frames_retrieved=frames_retrieved)
+                next_retrieve = max(next_retrieve + interval, now)
+    video.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Capture a camera and publish its encoded frames to a shared memory ring. "
+                    "The RTSP link is read from stdin so its credentials do not show in the process list.")
+    parser.add_argument('--shm', required=True, help="Name of the shared memory ring created by the API")
+    parser.add_argument('--slots', type=int, default=RING_SLOTS)
+    parser.add_argument('--max-frame-bytes', type=int, default=MAX_FRAME_BYTES)
+    parser.add_argument('--decode-fps', type=float, required=True)
+    parser.add_argument('--quality', type=int, default=90)
+    args = parser.parse_args()
+    rtsp_link = sys.stdin.readline().strip()
+    ring = SharedFrameRing(args.shm, args.slots, args.max_frame_bytes)
+    try:
+        capture(rtsp_link, ring, args.decode_fps, args.quality)
+    finally:
+        ring.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Selects the points of a series to keep with the Largest-Triangle-Three-Buckets algorithm.
+
+    The series is split into `threshold - 2` buckets and the point of each bucket forming the
+    largest triangle with the previously selected point and the average of the next bucket is
+    kept, along with the first and last points. This keeps the visual shape of the series.
+
+    Args:
+        x (numpy.ndarray): The x values of the series (e.g. timestamps), increasing.
+        y (numpy.ndarray): The y values of the series.
+        threshold (int): The number of points to keep.
+
+    Returns:
+        numpy.ndarray: The sorted indices of the selected points.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # Bucket edges over the points between the first and the last one
+    edges = (np.arange(threshold - 1) * (n - 2)) // (threshold - 2) + 1
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        average_x = x[end:next_end].mean()
+        average_y = y[end:next_end].mean()
+        areas = np.abs((x[a] - average_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (average_y - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def min_max_indices(y, threshold):
+    """
+    Selects the points of a series to keep by keeping the minimum and maximum of each bucket.
+
+    Args:
+        y (numpy.ndarray): The y values of the series.
+        threshold (int): The number of points to keep.
+
+    Returns:
+        numpy.ndarray: The sorted indices of the selected points.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 4:
+        return np.arange(n)
+    buckets = (threshold - 2) // 2
+    edges = (np.arange(buckets + 1) * n) // buckets
+    selected = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = y[start:end]
+        selected.append(start + int(np.argmin(bucket)))
+        selected.append(start + int(np.argmax(bucket)))
+    return np.unique(selected)
+
+
+def downsample_indices(x, series, threshold, mode='lttb', keep=()):
+    """
+    Selects the points to keep so that every series keeps its shape.
+
+    The point budget is shared between the series; each one selects its own points (NaN values,
+    e.g. before the moving average starts, are skipped) and the selections are merged, so the
+    returned indices can be used to sample every series consistently.
+
+    Args:
+        x (numpy.ndarray): The x values shared by the series (e.g. timestamps), increasing.
+        series (list): The y values of every series, each the same length as `x`.
+        threshold (int): The approximate number of points to keep.
+        mode (str): 'lttb' for Largest-Triangle-Three-Buckets, 'minmax' for bucket minimum and maximum.
+        keep (iterable): Indices that must be kept (e.g. the detection indices).
+
+    Returns:
+        numpy.ndarray: The sorted indices of the selected points.
+    """
+    if mode not in ('lttb', 'minmax'):
+        raise ValueError(f"Unknown downsampling mode: {mode}")
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    budget = max(threshold // len(series), 4)
+    selected = [np.asarray([index for index in keep if 0 <= index < n], dtype=np.int64)]
+    for y in series:
+        valid = np.flatnonzero(~np.isnan(y))
+        if len(valid) == 0:
+            continue
+        # NaN values only lead a series, so the valid values are contiguous
+        offset = valid[0]
+        values = y[offset:]
+        if mode == 'lttb':
+            indices = lttb_indices(x[offset:], values, budget)
+        else:
+            indices = min_max_indices(values, budget)
+        selected.append(indices + offset)
+    return np.unique(np.concatenate(selected))
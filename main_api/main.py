@@ -1,86 +1,731 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 from flask_cors import CORS
 from datetime import datetime
 import cv2
 import threading
 import time
 import csv
+import json
+import queue
+import atexit
+import math
+import cProfile
+import io
+import pstats
+import subprocess
+import sys
+import os
+from array import array
+import numpy as np
+from signal_engine import CureSignalEngine, CureConfig
+from run_log import RunLog
+from downsample import downsample_indices
+from replay import Replay, ReplayVideo, scale_image
+from metrics import MetricsRegistry
+from thermal import ThermalAnalyzer, ThermalSeries, ThermalMonitor
+from camera_worker import SharedFrameRing, CONNECTING, STREAMING, RECONNECTING
 
 
 app = Flask(__name__)
-sent_time = time.time()
 CORS(app)
+api_start_time = time.time()
 
 reader = []
 reader_index = 0
 start_read_flag = 0
 
-MIN_LENGTH_OF_DATA = 60
-MOVING_AVERAGE_WINDOW = 30
-DELAY_LAMP_TURN_OFF = 50 # Seconds
-FREQUENCY = 0.5  # per second
+MAX_STORED_SAMPLES = None  # Samples kept in memory per run, None keeps the whole run
+RUN_LOG_PATH = 'runs.sqlite3'  # On-disk log of every run, None disables it
+DEFAULT_SENSOR_ID = 'default'
+THERMAL_SENSOR_ID = DEFAULT_SENSOR_ID  # The sensor of the part the thermal camera watches
+HISTORY_POINTS = 1000  # Default number of points returned by /api/get_history
+STREAM_FPS = 10  # Frames per second sent to every viewer
+# Seconds without a new frame after which a viewer is sent the last one again, so the
+# write to a disconnected viewer fails and its stream ends
+FRAME_KEEP_ALIVE = 5
+CAMERA_QUALITY = 90  # JPEG quality of the camera frames, the quality of the full stream tier
+STREAM_SCALES = (1.0, 0.5, 0.25, 0.125)  # Scales a stream can be sent at, requested scales are rounded down to one
+MIN_STREAM_QUALITY = 10
+MAX_STREAM_QUALITY = 95
+STREAM_QUALITY_STEP = 5  # Requested qualities are rounded to a multiple, so viewers share fewer tiers
+# Named stream tiers: scale, JPEG quality and frames per second (None for the rate of the stream)
+STREAM_TIERS = {
+    'full': (1.0, CAMERA_QUALITY, None),
+    'medium': (0.5, 75, None),
+    'low': (0.25, 60, 5),
+}
+CAMERA_DECODE_FPS = STREAM_FPS  # Frames per second decoded from each camera
+CAMERA_RECONNECT_DELAY = 1  # Seconds, doubled after every failed reconnect
+CAMERA_MAX_RECONNECT_DELAY = 30  # Seconds
+CAMERA_IDLE_TIMEOUT = 30  # Seconds without viewers after which a camera is closed
+CAMERA_PROCESSES = True  # Capture and encode the cameras in worker processes instead of threads of the API
+CAMERA_WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'camera_worker.py')
+TEST_DATA_PATH = "../Data_to_use/09.04_test1/optimold_c_716_240409_144515.txt"  # Recorded run for tests and replays
+RUNS_DIRECTORY = '../Data_to_use'  # The only directory replays read recorded runs from
+RUN_EXTENSIONS = ('.txt', '.csv')  # Extensions of the recorded runs
+TEST_MOVIE_PATH = '../Data_to_use/test1_cropped.mp4'  # Recorded RGB video of the test run
+TEST_MOVIE_TH_PATH = '../Data_to_use/test1_thermo_cropped.mp4'  # Recorded thermal video of the test run
+MOVIE_FPS = 30  # Maximum frames per second sent from the test videos
+# Seconds over which the local UTC offset is looked up once when formatting times,
+# time zone changes happen on multiples of it
+TIME_ZONE_BLOCK = 900
+EPOCH = datetime(1970, 1, 1)
+
+# The names of the capture states published by the camera workers
+CAPTURE_STATES = {CONNECTING: 'connecting', STREAMING: 'streaming', RECONNECTING: 'reconnecting'}
+
+# The detection flags reported as discrete events, with the index reported alongside them
+DETECTION_EVENTS = {
+    'lamp_turn_off_flag': ('lamp_turn_off', 'lamp_turn_off_index'),
+    'gel_point_flag': ('gel_point', 'geling_point_index'),
+    'saturation_flag': ('saturation', 'saturation_index'),
+}
+
+# Metrics served at /metrics. Counters and histograms are updated on the hot paths,
+# gauges are computed when the metrics are collected.
+metrics = MetricsRegistry()
+# Its count is the number of samples ingested, so ingest needs no separate counter
+process_input_data_seconds = metrics.histogram(
+    'exofuse_process_input_data_seconds', "Time to process one sample.", ('sensor_id',))
+add_data_seconds = metrics.histogram(
+    'exofuse_add_data_seconds', "Time to handle an ingest request.", ('endpoint',))
+get_data_seconds = metrics.histogram('exofuse_get_data_seconds', "Time to build a /api/get_data response.")
+get_data_bytes = metrics.counter('exofuse_get_data_response_bytes_total', "Bytes sent by /api/get_data.")
+frame_encode_seconds = metrics.histogram(
+    'exofuse_frame_encode_seconds', "Time to encode a camera frame as JPEG.", ('camera',))
+tier_encode_seconds = metrics.histogram(
+    'exofuse_tier_encode_seconds', "Time to encode a frame of a reduced stream tier as JPEG.",
+    ('stream', 'scale', 'quality'))
+request_seconds = metrics.histogram(
+    'exofuse_request_seconds', "Time to handle a request, while request timing is on.", ('endpoint', 'method'))
+
+# The open MJPEG streams by stream name
+open_streams = {}
+open_streams_lock = threading.Lock()
 
 # Use VideoCapture in a separate thread
 class VideoCamera(object):
     """
     Represents a video camera object that captures frames from a given RTSP link.
 
+    The camera is only opened by `open` (on the first viewer), in the capture thread, so an
+    unreachable camera never blocks the caller. The capture thread grabs every frame the
+    stream delivers (so the stream never lags behind), but only retrieves (converts to an
+    image) up to `decode_fps` frames per second, which is all the viewers ever receive. Each
+    retrieved frame gets a sequence number, so an unchanged frame is never encoded twice. A
+    dropped stream is reopened with exponential backoff.
+
     Attributes:
-        video (cv2.VideoCapture): The video capture object.
-        grabbed (bool): Indicates if a frame was successfully grabbed.
+        rtsp_link (str): The RTSP link to the video stream.
+        decode_fps (float): The maximum number of frames retrieved per second.
+        name (str): The name of the camera in the metrics.
+        frames_retrieved (int): The number of frames retrieved, for the metrics.
+        read_failures (int): The number of failed reads, for the metrics.
+        state (str): 'closed', 'connecting', 'streaming' or 'reconnecting'.
         frame (numpy.ndarray): The current frame captured by the camera.
+        frame_time (float): The time the current frame was retrieved, in seconds since the epoch.
+        sequence (int): The number of frames retrieved so far, identifying `frame`.
+        encoded (bytes): The last encoded frame.
+        encoded_sequence (int): The sequence number of the frame `encoded` was made from.
+        lock (threading.Lock): Guards the encoded frame.
+        state_lock (threading.Lock): Orders the state set by the capture thread after `close`.
+        stop_event (threading.Event): Set by `close` to stop the current capture thread.
         thread (threading.Thread): The thread used to continuously update the frame.
 
     Methods:
-        __init__(self, rtsp_link): Initializes the VideoCamera object.
-        update_frame(self): Continuously updates the frame from the video capture.
+        __init__(self, rtsp_link, decode_fps, name): Initializes the VideoCamera object.
+        open(self): Starts capturing in the background.
+        close(self): Stops capturing, the capture thread releases the stream.
+        update_frame(self, stop_event): Continuously updates the frame from the video capture.
+        set_state(self, stop_event, state): Sets the state unless the camera was closed.
         get_frame(self): Encodes the current frame as a JPEG image and returns it.
-        __del__(self): Releases the video capture object when the VideoCamera object is destroyed.
+        get_image(self, scale): Returns the current frame scaled down.
+        get_status(self): Returns the state of the camera.
     """
 
-    def __init__(self, rtsp_link):
+    def __init__(self, rtsp_link, decode_fps=CAMERA_DECODE_FPS, name='camera'):
         """
-        Initializes the VideoCamera object.
+        Initializes the VideoCamera object, without opening the stream.
 
         Args:
             rtsp_link (str): The RTSP link to the video stream.
+            decode_fps (float): The maximum number of frames retrieved per second.
+            name (str): The name of the camera in the metrics (the link may hold credentials).
+        """
+        self.rtsp_link = rtsp_link
+        self.decode_fps = decode_fps
+        self.name = name
+        self.frames_retrieved = 0
+        self.read_failures = 0
+        self.state = 'closed'
+        self.frame = None
+        self.frame_time = None
+        self.sequence = 0
+        self.encoded = None
+        self.encoded_sequence = 0
+        self.lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.stop_event = None
+        self.thread = None
+
+    def open(self):
         """
-        self.video = cv2.VideoCapture(rtsp_link)
-        self.grabbed, self.frame = self.video.read()
-        self.thread = threading.Thread(target=self.update_frame, args=())
+        Starts capturing in the background. Opening the stream happens in the capture thread.
+        """
+        if self.stop_event is not None:
+            return
+        self.state = 'connecting'
+        self.frame = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.update_frame, args=(self.stop_event,))
         self.thread.daemon = True
         self.thread.start()
 
-    def update_frame(self):
+    def close(self):
         """
-        Continuously updates the frame from the video capture.
+        Stops capturing. The capture thread releases the stream once its current read returns.
         """
-        while True:
-            self.grabbed, self.frame = self.video.read()
+        if self.stop_event is None:
+            return
+        with self.state_lock:
+            self.stop_event.set()
+            self.stop_event = None
+            self.state = 'closed'
+
+    def set_state(self, stop_event, state):
+        """
+        Sets the state from the capture thread, unless `close` stopped that thread meanwhile.
+
+        Args:
+            stop_event (threading.Event): The stop event of the capture thread.
+            state (str): The new state.
+
+        Returns:
+            bool: Whether the state was set.
+        """
+        with self.state_lock:
+            if stop_event.is_set():
+                return False
+            self.state = state
+            return True
+
+    def update_frame(self, stop_event):
+        """
+        Opens the stream and continuously updates the frame until `stop_event` is set.
+
+        Args:
+            stop_event (threading.Event): Set when the camera is closed.
+        """
+        interval = 1 / self.decode_fps
+        next_retrieve = time.monotonic()
+        delay = CAMERA_RECONNECT_DELAY
+        video = cv2.VideoCapture(self.rtsp_link)
+        while not stop_event.is_set():
+            if not video.grab():
+                self.read_failures += 1
+                self.set_state(stop_event, 'reconnecting')
+                print(f"Camera stream {self.name} dropped, reconnecting in {delay} s")
+                video.release()
+                if stop_event.wait(delay):
+                    return
+                delay = min(delay * 2, CAMERA_MAX_RECONNECT_DELAY)
+                video = cv2.VideoCapture(self.rtsp_link)
+                continue
+            delay = CAMERA_RECONNECT_DELAY
+            now = time.monotonic()
+            # Frames nobody will be served are grabbed but never retrieved
+            if now >= next_retrieve:
+                retrieved, frame = video.retrieve()
+                if retrieved and self.set_state(stop_event, 'streaming'):
+                    self.frame = frame
+                    self.frame_time = time.time()
+                    self.sequence += 1
+                    self.frames_retrieved += 1
+                    next_retrieve = max(next_retrieve + interval, now)
+        video.release()
 
     def get_frame(self):
         """
         Encodes the current frame as a JPEG image and returns it.
 
+        The frame is only encoded once; later calls return the cached bytes until the
+        camera retrieves a new frame.
+
+        Returns:
+            bytes: The encoded frame as a JPEG image, or None before the first frame.
+        """
+        with self.lock:
+            sequence, frame = self.sequence, self.frame
+            if frame is None:
+                return None
+            if sequence != self.encoded_sequence:
+                start = time.perf_counter()
+                encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), CAMERA_QUALITY]
+                self.encoded = cv2.imencode('.jpg', frame, encode_param)[1].tobytes()
+                self.encoded_sequence = sequence
+                frame_encode_seconds.observe(time.perf_counter() - start, (self.name,))
+            return self.encoded
+
+    def get_image(self, scale=1.0):
+        """
+        Returns the current frame scaled down, for the reduced stream tiers.
+
+        Args:
+            scale (float): The scale, one of STREAM_SCALES.
+
+        Returns:
+            numpy.ndarray: The scaled frame, or None before the first frame.
+        """
+        return scale_image(self.frame, scale)
+
+    def get_status(self):
+        """
+        Returns the state of the camera.
+
+        Returns:
+            dict: The name, state, seconds since the last frame (None without one) and counters.
+        """
+        return {
+            'name': self.name,
+            'state': self.state,
+            'frame_age': time.time() - self.frame_time if self.state != 'closed' and self.frame_time else None,
+            'frames_retrieved': self.frames_retrieved,
+            'read_failures': self.read_failures,
+        }
+
+class CameraProcess:
+    """
+    Captures and encodes a camera in a separate process and reads its frames from shared memory.
+
+    Decoding and JPEG encoding run in `camera_worker.py`, outside the API process, so they do
+    not compete with ingest and requests for the GIL. The worker is only started by `open` (on
+    the first viewer) and stopped by `close`. It publishes the encoded frames to a
+    SharedFrameRing with a sequence counter; the API only copies the newest frame out once
+    per new frame. The worker only encodes while frames are being read, and is restarted with
+    exponential backoff if it exits. It has the same interface as VideoCamera, so a
+    FrameBroadcaster can serve it.
+
+    Attributes:
+        rtsp_link (str): The RTSP link to the video stream.
+        decode_fps (float): The maximum number of frames retrieved per second.
+        quality (int): The JPEG quality the worker encodes the frames at.
+        name (str): The name of the camera in the metrics.
+        ring (SharedFrameRing): The shared memory the worker publishes the frames to, None while closed.
+        process (subprocess.Popen): The worker process, None while closed.
+        encoded (bytes): The last frame read from the ring.
+        encoded_sequence (int): The sequence number of `encoded`.
+        frame_time (float): The time `encoded` was read from the ring, in seconds since the epoch.
+        counters (dict): The frames retrieved and read failures of the previous openings.
+        lock (threading.Lock): Guards the ring and the last frame.
+        thread (threading.Thread): The thread restarting the worker when it exits.
+
+    Methods:
+        open(): Creates the ring and starts the worker process.
+        close(): Stops the worker process and frees the shared memory.
+        start_process(ring): Starts a worker process on a ring.
+        supervise(ring): Restarts the worker process when it exits.
+        get_frame(): Returns the newest encoded frame.
+        get_image(scale): Decodes the newest frame scaled down.
+        get_status(): Returns the state of the camera and of its worker.
+    """
+
+    def __init__(self, rtsp_link, decode_fps=CAMERA_DECODE_FPS, name='camera', quality=CAMERA_QUALITY):
+        self.rtsp_link = rtsp_link
+        self.decode_fps = decode_fps
+        self.quality = quality
+        self.name = name
+        self.ring = None
+        self.process = None
+        self.encoded = None
+        self.encoded_sequence = 0
+        self.frame_time = None
+        self.counters = {'frames_retrieved': 0, 'read_failures': 0}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def open(self):
+        """
+        Creates the ring and starts the worker process, without waiting for the camera.
+        """
+        with self.lock:
+            if self.ring is not None:
+                return
+            self.ring = SharedFrameRing()
+            self.encoded = None
+            self.encoded_sequence = 0
+            self.start_process(self.ring)
+            self.thread = threading.Thread(target=self.supervise, args=(self.ring,))
+            self.thread.daemon = True
+            self.thread.start()
+
+    def close(self):
+        """
+        Stops the worker process and frees the shared memory.
+        """
+        with self.lock:
+            ring, process = self.ring, self.process
+            if ring is None:
+                return
+            header = ring.read_header()
+            for counter in self.counters:
+                self.counters[counter] += header[counter]
+            ring.update_header(stop=1)
+            self.ring = None
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        ring.close()
+        ring.unlink()
+
+    def start_process(self, ring):
+        """
+        Starts a worker process publishing to a ring.
+
+        Args:
+            ring (SharedFrameRing): The ring of the worker.
+        """
+        self.process = subprocess.Popen(
+            [sys.executable, CAMERA_WORKER, '--shm', ring.name, '--decode-fps', str(self.decode_fps),
+             '--quality', str(self.quality)],
+            stdin=subprocess.PIPE, text=True)
+        # The link holds the camera credentials, so it is not passed on the command line
+        self.process.stdin.write(self.rtsp_link + '\n')
+        self.process.stdin.close()
+
+    def supervise(self, ring):
+        """
+        Restarts the worker process with exponential backoff when it exits, until the ring is closed.
+
+        Args:
+            ring (SharedFrameRing): The ring of the worker.
+        """
+        delay = CAMERA_RECONNECT_DELAY
+        while True:
+            started = time.monotonic()
+            code = self.process.wait()
+            if self.ring is not ring:
+                return
+            if time.monotonic() - started > CAMERA_MAX_RECONNECT_DELAY:
+                delay = CAMERA_RECONNECT_DELAY
+            print(f"Camera process {self.name} exited with code {code}, restarting in {delay} s")
+            time.sleep(delay)
+            delay = min(delay * 2, CAMERA_MAX_RECONNECT_DELAY)
+            with self.lock:
+                if self.ring is not ring:
+                    return
+                self.start_process(ring)
+
+    @property
+    def sequence(self):
+        """
+        The sequence number of the newest frame.
+
+        Reading it tells the worker someone is watching, so it keeps encoding frames.
+        """
+        with self.lock:
+            if self.ring is None:
+                return self.encoded_sequence
+            self.ring.update_header(last_read=time.time())
+            return self.ring.latest_sequence()
+
+    def read_counter(self, counter):
+        with self.lock:
+            value = self.counters[counter]
+            if self.ring is not None:
+                value += self.ring.read_header()[counter]
+            return value
+
+    @property
+    def frames_retrieved(self):
+        return self.read_counter('frames_retrieved')
+
+    @property
+    def read_failures(self):
+        return self.read_counter('read_failures')
+
+    def get_frame(self):
+        """
+        Returns the newest encoded frame.
+
+        The frame is copied out of the ring once; later calls return the same bytes until the
+        worker publishes a new frame.
+
+        Returns:
+            bytes: The encoded frame as a JPEG image, or None before the first frame.
+        """
+        with self.lock:
+            if self.ring is not None and self.ring.latest_sequence() != self.encoded_sequence:
+                sequence, frame, encode_seconds = self.ring.read_latest()
+                if sequence:
+                    self.encoded = frame
+                    self.encoded_sequence = sequence
+                    self.frame_time = time.time()
+                    frame_encode_seconds.observe(encode_seconds, (self.name,))
+            return self.encoded
+
+    def get_image(self, scale=1.0):
+        """
+        Decodes the newest frame scaled down, for the reduced stream tiers.
+
+        The JPEG decoder scales by powers of two while decoding, which is much cheaper than
+        decoding the full frame and resizing it.
+
+        Args:
+            scale (float): The scale, one of STREAM_SCALES.
+
+        Returns:
+            numpy.ndarray: The scaled frame, or None before the first frame.
+        """
+        frame = self.get_frame()
+        if frame is None:
+            return None
+        return cv2.imdecode(np.frombuffer(frame, np.uint8), REDUCED_DECODE_FLAGS[scale])
+
+    def get_status(self):
+        """
+        Returns the state of the camera and of its worker.
+
         Returns:
-            bytes: The encoded frame as a JPEG image.
+            dict: The name, state, seconds since the last frame and the last worker heartbeat
+            (None without one), counters and worker PID.
+        """
+        with self.lock:
+            ring, process = self.ring, self.process
+            header = ring.read_header() if ring is not None else None
+        status = {'name': self.name, 'state': 'closed', 'frame_age': None, 'heartbeat_age': None, 'pid': None}
+        if header is not None:
+            now = time.time()
+            if process.poll() is not None:
+                status['state'] = 'restarting'
+            else:
+                status['state'] = CAPTURE_STATES[header['state']]
+            status['frame_age'] = now - self.frame_time if self.frame_time and self.encoded is not None else None
+            status['heartbeat_age'] = now - header['heartbeat'] if header['heartbeat'] else None
+            status['pid'] = process.pid
+        status['frames_retrieved'] = self.frames_retrieved
+        status['read_failures'] = self.read_failures
+        return status
+
+# The JPEG decoding flags scaling a frame down while decoding it, by scale
+REDUCED_DECODE_FLAGS = {
+    1.0: cv2.IMREAD_COLOR,
+    0.5: cv2.IMREAD_REDUCED_COLOR_2,
+    0.25: cv2.IMREAD_REDUCED_COLOR_4,
+    0.125: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class StreamTier:
+    """
+    The frames of one scale and JPEG quality of a stream, shared by the viewers watching it.
+
+    Attributes:
+        scale (float): The scale of the frames, one of STREAM_SCALES.
+        quality (int): The JPEG quality of the frames.
+        viewers (int): The number of viewers watching this tier.
+        frame (bytes): The last encoded frame, as a multipart/x-mixed-replace part.
+        sequence (int): The number of frames encoded for this tier so far.
+        source (int): The sequence number of the camera frame the last frame was encoded from.
+    """
+
+    def __init__(self, scale, quality):
+        self.scale = scale
+        self.quality = quality
+        self.viewers = 0
+        self.frame = None
+        self.sequence = 0
+        self.source = 0
+
+
+class FrameBroadcaster:
+    """
+    Encodes the frames of a camera once per stream tier and shares them with every viewer.
+
+    A single thread encodes each new camera frame as a JPEG (at most `fps` times per second and
+    only while someone is watching) once for every tier (scale and quality) a viewer watches,
+    and every viewer waits on a condition for the next frame of its tier. Encoding cost
+    therefore grows with the number of distinct tiers, not with the number of viewers, and
+    each viewer paces itself with blocking waits instead of spinning. The full size tier at
+    CAMERA_QUALITY is the frame the camera already encoded.
+
+    A lazy broadcaster opens its camera when the first viewer connects and closes it once
+    nobody watched for `CAMERA_IDLE_TIMEOUT` seconds, both from its own thread, so neither
+    importing the API nor a request ever waits for a camera. Holding the broadcaster keeps the
+    camera open without a viewer, for consumers reading the camera directly.
+
+    Attributes:
+        camera (VideoCamera): The camera the frames are read from.
+        fps (float): The maximum number of frames encoded per second.
+        lazy (bool): Whether the broadcaster opens and closes the camera.
+        name (str): The name of the stream in the metrics.
+        condition (threading.Condition): Signals new frames and viewer changes.
+        tiers (dict): The StreamTier objects watched by someone, by (scale, quality).
+        sequence (int): The number of camera frames encoded so far.
+        viewers (int): The number of connected viewers.
+        holders (int): The number of consumers keeping the camera open.
+        camera_open (bool): Whether the broadcaster opened the camera.
+        thread (threading.Thread): The thread encoding the frames.
+
+    Methods:
+        hold(): Keeps the camera open without a viewer.
+        release(): Stops keeping the camera open.
+        encode_frames(): Encodes the new camera frames while someone is watching.
+        encode_tiers(tiers): Encodes the current camera frame for some tiers.
+        frames(fps, scale, quality): Yields the encoded frames of a tier to one viewer.
+    """
+
+    def __init__(self, camera, fps=STREAM_FPS, lazy=False, name='stream'):
+        self.camera = camera
+        self.fps = fps
+        self.lazy = lazy
+        self.name = name
+        self.condition = threading.Condition()
+        self.tiers = {}
+        self.sequence = 0
+        self.viewers = 0
+        self.holders = 0
+        self.camera_open = False
+        self.thread = threading.Thread(target=self.encode_frames, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def hold(self):
+        """
+        Keeps the camera open (and its frames new) without a viewer.
+        """
+        with self.condition:
+            self.holders += 1
+            self.condition.notify_all()
+
+    def release(self):
+        """
+        Stops keeping the camera open, it is closed once nobody holds or watches it.
+        """
+        with self.condition:
+            self.holders -= 1
+
+    def encode_frames(self):
+        """
+        Encodes the new camera frames while someone is watching.
+        """
+        interval = 1 / self.fps
+        while True:
+            with self.condition:
+                watched = self.condition.wait_for(lambda: self.viewers > 0 or self.holders > 0,
+                                                  CAMERA_IDLE_TIMEOUT if self.camera_open else None)
+                sequence = self.camera.sequence
+                # Only encode frames the camera has not delivered to a tier before, a tier
+                # created since the last frame gets the current one
+                tiers = [(tier.scale, tier.quality) for tier in self.tiers.values() if tier.source != sequence]
+            if self.lazy and watched != self.camera_open:
+                if watched:
+                    self.camera.open()
+                else:
+                    self.camera.close()
+                self.camera_open = watched
+            if not watched:
+                continue
+            frames = self.encode_tiers(tiers) if tiers else {}
+            if frames:
+                with self.condition:
+                    for key, frame in frames.items():
+                        tier = self.tiers.get(key)
+                        if tier is not None:
+                            tier.frame = (b'--frame\r\n'
+                                          b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                            tier.sequence += 1
+                            tier.source = sequence
+                    self.sequence += 1
+                    self.condition.notify_all()
+            time.sleep(interval)
+
+    def encode_tiers(self, tiers):
         """
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
-        frame = cv2.imencode('.jpg', self.frame, encode_param)[1].tobytes()
-        return frame
+        Encodes the current camera frame for some tiers.
+
+        The frame is scaled once per scale, whatever the number of qualities watched at it.
+
+        Args:
+            tiers (list): The (scale, quality) tiers to encode.
 
-    def __del__(self):
+        Returns:
+            dict: The JPEG images by tier, without the tiers the camera had no frame for.
         """
-        Releases the video capture object when the VideoCamera object is destroyed.
+        frames = {}
+        images = {}
+        for scale, quality in tiers:
+            if scale == 1 and quality == CAMERA_QUALITY:
+                frame = self.camera.get_frame()
+            else:
+                if scale not in images:
+                    images[scale] = self.camera.get_image(scale)
+                if images[scale] is None:
+                    continue
+                start = time.perf_counter()
+                frame = cv2.imencode('.jpg', images[scale], [int(cv2.IMWRITE_JPEG_QUALITY), quality])[1].tobytes()
+                tier_encode_seconds.observe(time.perf_counter() - start, (self.name, scale, quality))
+            if frame is not None:
+                frames[(scale, quality)] = frame
+        return frames
+
+    def frames(self, fps=STREAM_FPS, scale=1.0, quality=CAMERA_QUALITY):
         """
-        self.video.release()
+        Yields the encoded frames of a tier to one viewer.
+
+        The viewer always gets the newest frame; frames encoded while it was busy are skipped,
+        so a slow viewer never receives stale frames. While no new frame comes (a frozen or
+        closed camera), the last one is sent again every FRAME_KEEP_ALIVE seconds (a bare line
+        break before the first one), since only a failed write tells a disconnected viewer
+        apart and ends its generator.
+
+        Args:
+            fps (float): The maximum number of frames per second sent to this viewer.
+            scale (float): The scale of the frames, one of STREAM_SCALES.
+            quality (int): The JPEG quality of the frames.
 
-def gen_frame(camera):
+        Yields:
+            bytes: The frames as multipart/x-mixed-replace parts.
+        """
+        interval = 1 / fps
+        last_sequence = 0
+        key = (scale, quality)
+        with self.condition:
+            tier = self.tiers.get(key)
+            if tier is None:
+                tier = self.tiers[key] = StreamTier(scale, quality)
+            tier.viewers += 1
+            self.viewers += 1
+            self.condition.notify_all()
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: tier.frame is not None and tier.sequence != last_sequence,
+                                            FRAME_KEEP_ALIVE)
+                    last_sequence = tier.sequence
+                    # The line break is skipped as padding before the first part
+                    frame = tier.frame if tier.frame is not None else b'\r\n'
+                sent_time = time.monotonic()
+                yield frame
+                time.sleep(max(0.0, interval - (time.monotonic() - sent_time)))
+        finally:
+            with self.condition:
+                tier.viewers -= 1
+                self.viewers -= 1
+                if not tier.viewers and self.tiers.get(key) is tier:
+                    del self.tiers[key]
+
+
+def gen_frame(broadcaster, fps=STREAM_FPS, scale=1.0, quality=CAMERA_QUALITY):
     """
-    Generates frames from a camera stream (10 fps).
+    Generates frames from a camera stream (10 fps at full size by default).
 
     Args:
-        camera: The camera object used to capture frames.
+        broadcaster (FrameBroadcaster): The broadcaster sharing the encoded frames of the camera.
+        fps (float): The maximum number of frames per second.
+        scale (float): The scale of the frames, one of STREAM_SCALES.
+        quality (int): The JPEG quality of the frames.
 
     Yields:
         bytes: A sequence of frames in the form of bytes.
@@ -89,23 +734,100 @@ def gen_frame(camera):
         None
 
     Example:
-        >>> camera = Camera()
-        >>> for frame in gen_frame(camera):
+        >>> broadcaster = FrameBroadcaster(VideoCamera(rtsp_link))
+        >>> for frame in gen_frame(broadcaster, scale=0.5, quality=75):
         ...     # Process the frame
         ...     pass
     """
-    global sent_time
-    while True:
-        # To maintain 10 fps
-        if time.time() - sent_time >= 0.1:
-            frame = camera.get_frame()
-            sent_time = time.time()
-            yield (b'--frame\r\n'
-                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-           
+    yield from broadcaster.frames(fps, scale, quality)
+
+
+def get_stream_tier(fps):
+    """
+    Returns the stream tier a request asks for.
+
+    The 'tier' query parameter picks one of STREAM_TIERS ('full' by default), and the 'scale',
+    'quality' and 'fps' query parameters override its values. The scale is rounded down to one
+    of STREAM_SCALES and the quality to a multiple of STREAM_QUALITY_STEP, so that similar
+    requests share a tier.
+
+    Args:
+        fps (float): The frame rate of the stream, the highest a viewer gets.
+
+    Returns:
+        tuple: The frames per second, scale and JPEG quality.
+
+    Raises:
+        ValueError: If a parameter is unknown or out of range.
+    """
+    name = request.args.get('tier', 'full')
+    if name not in STREAM_TIERS:
+        raise ValueError(f"tier must be one of {', '.join(STREAM_TIERS)}")
+    scale, quality, tier_fps = STREAM_TIERS[name]
+    scale = float(request.args.get('scale', scale))
+    quality = int(request.args.get('quality', quality))
+    tier_fps = float(request.args.get('fps', tier_fps or fps))
+    if not 0 < scale <= 1:
+        raise ValueError("scale must be in (0, 1]")
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be in [1, 100]")
+    if not tier_fps > 0:
+        raise ValueError("fps must be positive")
+    scale = next((candidate for candidate in STREAM_SCALES if candidate <= scale), STREAM_SCALES[-1])
+    quality = round(quality / STREAM_QUALITY_STEP) * STREAM_QUALITY_STEP
+    quality = min(max(quality, MIN_STREAM_QUALITY), MAX_STREAM_QUALITY)
+    return min(tier_fps, fps), scale, quality
+
+
+def stream_response(stream, broadcaster):
+    """
+    Returns the MJPEG stream of a broadcaster at the tier the request asks for.
+
+    Args:
+        stream (str): The name of the stream in the metrics.
+        broadcaster (FrameBroadcaster): The broadcaster of the stream.
+
+    Returns:
+        Response: The multipart/x-mixed-replace stream, or a JSON error and HTTP status code 400
+        if the tier parameters are invalid.
+    """
+    try:
+        fps, scale, quality = get_stream_tier(broadcaster.fps)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid stream parameters: {e}'}), 400
+    return Response(track_stream(stream, gen_frame(broadcaster, fps, scale, quality)),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+
+def track_stream(stream, frames):
+    """
+    Counts a viewer of a MJPEG stream in the metrics for as long as it is connected.
+
+    Args:
+        stream (str): The name of the stream.
+        frames (iterator): The frames sent to the viewer.
 
-camera = VideoCamera('rtsp://user:password@ip_camera:554/Streaming/Channels/101')
-camera_th = VideoCamera('rtsp://user:password@ip_camera:554/Streaming/Channels/201')
+    Yields:
+        bytes: The frames.
+    """
+    with open_streams_lock:
+        open_streams[stream] = open_streams.get(stream, 0) + 1
+    try:
+        yield from frames
+    finally:
+        with open_streams_lock:
+            open_streams[stream] -= 1
+
+
+camera_class = CameraProcess if CAMERA_PROCESSES else VideoCamera
+camera = camera_class('rtsp://user:password@ip_camera:554/Streaming/Channels/101', name='rgb')
+camera_th = camera_class('rtsp://user:password@ip_camera:554/Streaming/Channels/201', name='thermal')
+cameras = [camera, camera_th]
+for lazy_camera in cameras:
+    atexit.register(lazy_camera.close)
+# The cameras are opened by their broadcaster on the first viewer, in the background
+broadcaster = FrameBroadcaster(camera, lazy=True, name='video_feed')
+broadcaster_th = FrameBroadcaster(camera_th, lazy=True, name='video_feed_th')
 
 @app.route('/api/video_feed')
 def video_feed():
@@ -115,12 +837,14 @@ def video_feed():
     This function generates frames from the camera and returns them as a response with the appropriate MIME type.
     The frames are sent as a multipart/x-mixed-replace stream, which allows for continuous streaming of video.
 
+    Query Parameters:
+        tier, scale, quality, fps (optional): The stream tier, see `get_stream_tier`.
+
     Returns:
         Response: A response object containing the video feed.
 
     """
-    global camera
-    return Response(gen_frame(camera), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return stream_response('video_feed', broadcaster)
 
 @app.route('/api/video_feed_th')
 
@@ -131,90 +855,346 @@ def video_feed_th():
     This function generates frames from the camera and returns them as a response with the appropriate MIME type.
     The frames are sent as a multipart/x-mixed-replace stream, which allows for continuous streaming of video.
 
+    Query Parameters:
+        tier, scale, quality, fps (optional): The stream tier, see `get_stream_tier`.
+
     Returns:
         Response: A response object containing the video feed.
 
     """
-    global camera_th
-    return Response(gen_frame(camera_th), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return stream_response('video_feed_th', broadcaster_th)
 
 
 
 ## Showing from mp4 videos
-def generate_frames_video(video):
+# The test videos played in real time, opened by their broadcaster on the first viewer
+movie = ReplayVideo(TEST_MOVIE_PATH, CAMERA_QUALITY)
+movie_th = ReplayVideo(TEST_MOVIE_TH_PATH, CAMERA_QUALITY)
+movie_broadcaster = FrameBroadcaster(movie, fps=MOVIE_FPS, lazy=True, name='test_movie')
+movie_broadcaster_th = FrameBroadcaster(movie_th, fps=MOVIE_FPS, lazy=True, name='test_movie_th')
+
+@app.route('/api/test_movie')
+def test_movie():
+    """
+    Streams the RGB test video in real time, from the beginning for the first viewer.
+
+    While a replay is running, the video follows the replay clock instead. Once it finished
+    or was stopped, new viewers get the real-time video again.
+
+    Query Parameters:
+        tier, scale, quality, fps (optional): The stream tier, see `get_stream_tier`.
+
+    Returns:
+        A Response object with the generated video frames, with the mimetype set to 'multipart/x-mixed-replace; boundary=frame'.
+    """
+    return stream_response('test_movie', replay_broadcaster if replay_running() else movie_broadcaster)
+
+@app.route('/api/test_movie_th')
+def test_movie_th():
+    """
+    Streams the thermal test video in real time, from the beginning for the first viewer.
+
+    While a replay is running, the video follows the replay clock instead. Once it finished
+    or was stopped, new viewers get the real-time video again.
+
+    Query Parameters:
+        tier, scale, quality, fps (optional): The stream tier, see `get_stream_tier`.
+
+    Returns:
+        A Response object with the generated video frames, with the mimetype set to 'multipart/x-mixed-replace; boundary=frame'.
+    """
+    return stream_response('test_movie_th', replay_broadcaster_th if replay_running() else movie_broadcaster_th)
+
+def replay_running():
+    """
+    Returns whether a replay is running, so the test videos follow its clock.
+
+    Returns:
+        bool: True from the start of a replay until it finished or was stopped.
+    """
+    current = replay
+    return current is not None and not current.finished
+
+# The test videos as played by replays, on the replay clock
+replay = None
+replay_lock = threading.Lock()
+replay_video = ReplayVideo(TEST_MOVIE_PATH, CAMERA_QUALITY)
+replay_video_th = ReplayVideo(TEST_MOVIE_TH_PATH, CAMERA_QUALITY)
+replay_broadcaster = FrameBroadcaster(replay_video, name='replay')
+replay_broadcaster_th = FrameBroadcaster(replay_video_th, name='replay_th')
+
+
+def get_detection_events(before, after):
     """
-    Generates frames from a video file and yields them as a multipart/x-mixed-replace response.
+    Lists the detection flags that changed between two detection states.
 
     Args:
-        video (cv2.VideoCapture): The video file to generate frames from.
+        before (dict): The detection state before a sample was added.
+        after (dict): The detection state after the sample was added.
 
-    Yields:
-        bytes: The frames of the video as a multipart/x-mixed-replace response.
+    Returns:
+        list: The (event, flag, index) tuples of the flags that changed.
+    """
+    return [(event, after[flag], after[index])
+            for flag, (event, index) in DETECTION_EVENTS.items() if after[flag] != before[flag]]
+
+
+def parse_sample(data):
+    """
+    Converts the temperature and resistance of a sample received from a request.
+
+    Args:
+        data (dict): The sample, with 'temperature' and 'resistance'.
+
+    Returns:
+        tuple: The temperature and resistance as floats.
 
     Raises:
-        None
+        ValueError: If a value is missing, not a number or not finite.
+    """
+    try:
+        temperature, resistance = float(data['temperature']), float(data['resistance'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"invalid sample: {e}")
+    if not (math.isfinite(temperature) and math.isfinite(resistance)):
+        raise ValueError("temperature and resistance must be finite")
+    return temperature, resistance
 
-    Example Usage:
-        video = cv2.VideoCapture('path/to/video.mp4')
-        for frame in generate_frames_video(video):
-            # Process the frame
-            pass
+
+def local_offset(second):
     """
-    
-    last_frame = None
-    fps = int(video.get(cv2.CAP_PROP_FPS))
-    frame_duration = 1 / fps  # duration of each frame in seconds
-
-    frame_count = 0
-    start_time = time.time()
-    while True:
-        success, frame = video.read()
-        frame_count += 1
-
-        if not success:
-            # If the video has ended, yield the last frame
-            if last_frame is not None:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + last_frame + b'\r\n')
-            continue
-
-        # Convert the image from BGR color (which OpenCV uses) to RGB color
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        # Encode the image as jpg
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame = buffer.tobytes()
-        # Store the frame as the last frame
-        last_frame = frame
-        # Yield the frame in the content type multipart/x-mixed-replace with boundary frame
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-
-        # Wait until it's time for the next frame
-        while time.time() - start_time < frame_count * frame_duration:
-            time.sleep(0.011)
+    Returns the local UTC offset at a time.
 
-@app.route('/api/test_movie')
-def test_movie():
+    Args:
+        second (int): The time in whole seconds since the epoch.
+
+    Returns:
+        int: The offset of the local time in seconds.
+    """
+    return int((datetime.fromtimestamp(second) - EPOCH).total_seconds()) - second
+
+
+def parse_timestamp(value):
     """
-    Generates a video response by calling the `generate_frames_video` function with `video1` as input.
+    Converts the timestamp of a sample received from a request.
+
+    Args:
+        value: The time of the sample in seconds since the epoch.
 
     Returns:
-        A Response object with the generated video frames, with the mimetype set to 'multipart/x-mixed-replace; boundary=frame'.
+        float: The timestamp.
+
+    Raises:
+        ValueError: If the value is not a number or not a time `datetime` can represent.
     """
-    return Response(generate_frames_video(video1), mimetype='multipart/x-mixed-replace; boundary=frame')
+    try:
+        timestamp = float(value)
+        datetime.fromtimestamp(timestamp)
+    except (TypeError, OverflowError, OSError) as e:
+        raise ValueError(f"invalid timestamp: {e}")
+    return timestamp
 
-@app.route('/api/test_movie_th')
-def test_movie_th():
+
+def format_times(timestamps):
     """
-    Generates a video response by calling the `generate_frames_video` function with `video1` as input.
+    Formats timestamps for the API.
+
+    The timestamps are rounded to the second like `datetime.fromtimestamp` and shifted to
+    local time with NumPy. The UTC offset is only looked up once per TIME_ZONE_BLOCK seconds
+    (per sample in the rare blocks a time zone change falls in), and NumPy formats the
+    dates, which gives the same strings as strftime for a fraction of the cost.
+
+    Args:
+        timestamps (array): Timestamps in seconds since the epoch.
 
     Returns:
-        A Response object with the generated video frames, with the mimetype set to 'multipart/x-mixed-replace; boundary=frame'.
+        list: The timestamps in the format of YYYY-MM-DD HH:MM:SS AM/PM.
+    """
+    times = np.asarray(timestamps, dtype=np.float64)
+    fraction, seconds = np.modf(times)
+    microseconds = np.round(fraction * 1e6)
+    seconds = seconds.astype(np.int64) + (microseconds >= 1e6) - (microseconds < 0)
+    blocks, inverse = np.unique(seconds // TIME_ZONE_BLOCK, return_inverse=True)
+    offsets = np.empty(len(blocks), dtype=np.int64)
+    changing = np.zeros(len(blocks), dtype=bool)
+    for i, start in enumerate((blocks * TIME_ZONE_BLOCK).tolist()):
+        offsets[i] = local_offset(start)
+        changing[i] = local_offset(start + TIME_ZONE_BLOCK - 1) != offsets[i]
+    local = seconds + offsets[inverse]
+    changed = np.flatnonzero(changing[inverse])
+    local[changed] = [second + local_offset(second) for second in seconds[changed].tolist()]
+    strings = np.datetime_as_string(local.astype('datetime64[s]')).tolist()
+    return [f"{text[:10]} {text[11:]} {'PM' if text[11:13] >= '12' else 'AM'}" for text in strings]
+
+
+class DataSnapshot:
+    """
+    An immutable, consistent view of a Sensor_Data pipeline at one point in time.
+
+    The writer publishes a new snapshot after every sample and every reset by replacing a
+    single attribute, so readers never take a lock and never block ingest. The columns are
+    only ever appended to (resets and the retention limit swap in new arrays instead of
+    editing them), so slicing the captured arrays up to the captured lengths always gives
+    series of matching length, even while new samples are being appended.
+
+    Attributes:
+        generation (int): The reset counter of the pipeline.
+        first_index (int): The sample index of the first value kept in memory.
+        sample_count (int): The number of samples added since the last reset.
+        columns (tuple): The temperature, resistance and time columns.
+        moving_average (array): The moving average column.
+        moving_average_length (int): The number of moving average values in the snapshot.
+        moving_average_start_index (int): The sample index of the first moving average value.
+        slopes (array): The slopes column.
+        slopes_length (int): The number of slopes in the snapshot.
+        slopes_start_index (int): The sample index of the first slope.
+        detection_state (dict): The detection flags and indices.
+
+    Methods:
+        get_data_since(since): Returns the data appended since a given sample index.
+        get_history(start, end, points, mode): Returns a downsampled time range of the run.
     """
-    return Response(generate_frames_video(video2), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-video1 = cv2.VideoCapture('../Data_to_use/test1_cropped.mp4') # For Test purposes 
-video2 = cv2.VideoCapture('../Data_to_use/test1_thermo_cropped.mp4') # For test Purposes
+    __slots__ = ('generation', 'first_index', 'sample_count', 'columns', 'moving_average',
+                 'moving_average_length', 'moving_average_start_index', 'slopes',
+                 'slopes_length', 'slopes_start_index', 'detection_state')
+
+    def __init__(self, sensor_data):
+        self.generation = sensor_data.generation
+        self.first_index = sensor_data.first_index
+        self.sample_count = sensor_data.first_index + len(sensor_data.stored_resistance)
+        self.columns = (sensor_data.stored_temperature, sensor_data.stored_resistance, sensor_data.stored_times)
+        self.moving_average = sensor_data.moving_average_resistance
+        self.moving_average_length = len(self.moving_average)
+        self.moving_average_start_index = sensor_data.moving_average_start_index
+        self.slopes = sensor_data.slopes_after_geling_point
+        self.slopes_length = len(self.slopes)
+        self.slopes_start_index = sensor_data.slopes_start_index
+        self.detection_state = {
+            'lamp_turn_off_flag': sensor_data.lamp_turn_off_flag,
+            'lamp_turn_off_index': sensor_data.lamp_turn_off_index,
+            'two_mins_earlier_lamp_turn_off_index': sensor_data.two_mins_earlier_lamp_turn_off_index,
+            'gel_point_flag': sensor_data.geling_point_flag,
+            'geling_point_index': sensor_data.geling_point_index,
+            'saturation_flag': sensor_data.saturation_flag,
+            'saturation_index': sensor_data.saturation_index
+        }
+
+    def get_data_since(self, since=0):
+        """
+        Returns the data appended since a given sample index.
+
+        The raw series are sliced from `since`, while the moving average and the slopes
+        are sliced from the sample they were computed at, so a client can append every
+        returned list to what it already holds. Samples dropped by the retention limit are
+        skipped. The timestamps are only formatted here, for the returned slice.
+
+        Args:
+            since (int): The number of samples the client already holds (0 for the full history).
+
+        Returns:
+            dict: The new part of every series along with the detection flags and indices.
+        """
+        since = max(since, self.first_index)
+        offset = since - self.first_index
+        length = self.sample_count - self.first_index
+        temperature, resistance, times = self.columns
+        moving_average_since = max(0, since - self.moving_average_start_index)
+        slopes_since = max(0, since - self.slopes_start_index)
+        state = self.detection_state
+        return {
+            'stored_resistance': resistance[offset:length].tolist(),
+            'stored_temperature': temperature[offset:length].tolist(),
+            'stored_time': format_times(times[offset:length]),
+            'lamp_turn_off_flag': state['lamp_turn_off_flag'],
+            'lamp_turn_off_index': state['lamp_turn_off_index'],
+            'two_mins_earlier_lamp_turn_off_index': state['two_mins_earlier_lamp_turn_off_index'],
+            'saturation_flag': state['saturation_flag'],
+            'saturation_index': state['saturation_index'],
+            'moving_average_resistance': self.moving_average[moving_average_since:self.moving_average_length].tolist(),
+            'slopes': self.slopes[slopes_since:self.slopes_length].tolist(),
+            "geling_point_index": state['geling_point_index'],
+            "gel_point_flag": state['gel_point_flag'],
+            'since': since,
+            'next_index': self.sample_count,
+            'generation': self.generation
+        }
+
+    def get_history(self, start=None, end=None, points=HISTORY_POINTS, mode='lttb'):
+        """
+        Returns a downsampled time range of the run for charting.
+
+        The points are selected so that the resistance, temperature and moving average keep
+        their shape (see `downsample_indices`), and the detection indices always survive and are
+        remapped to positions in the returned series. The payload size therefore depends on
+        `points`, not on the length of the cure. The range is a binary search of the stored
+        times, which `append_sample` keeps from decreasing.
+
+        Args:
+            start (float, optional): The start of the range in seconds since the epoch.
+            end (float, optional): The end of the range in seconds since the epoch.
+            points (int): The approximate number of points to return.
+            mode (str): 'lttb' or 'minmax'.
+
+        Returns:
+            dict: The downsampled series, the original sample index of every point and the remapped detection indices.
+        """
+        temperature, resistance, times = self.columns
+        length = self.sample_count - self.first_index
+        times = np.frombuffer(times[:length], dtype=np.float64)
+        low = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        high = length if end is None else int(np.searchsorted(times, end, side='right'))
+        high = max(low, high)
+        times = times[low:high]
+        resistance = np.frombuffer(resistance[low:high], dtype=np.float64)
+        temperature = np.frombuffer(temperature[low:high], dtype=np.float64)
+        # The moving average aligned with the samples, NaN before it starts
+        moving_average = np.full(high - low, np.nan)
+        moving_average_first = self.moving_average_start_index - self.first_index
+        overlap_start = max(low, moving_average_first)
+        overlap_end = min(high, moving_average_first + self.moving_average_length)
+        if self.moving_average_length and overlap_start < overlap_end:
+            moving_average[overlap_start - low:overlap_end - low] = np.frombuffer(
+                self.moving_average[overlap_start - moving_average_first:overlap_end - moving_average_first],
+                dtype=np.float64)
+
+        state = self.detection_state
+        detection_positions = {
+            index: state[index] - self.first_index - low
+            for index in ('lamp_turn_off_index', 'two_mins_earlier_lamp_turn_off_index',
+                          'geling_point_index', 'saturation_index')
+        }
+        x = times - times[0] if len(times) else times
+        selected = downsample_indices(x, [resistance, temperature, moving_average], points, mode,
+                                      keep=detection_positions.values())
+
+        def remap(index):
+            # Same convention as get_data (0 while the engine has not set the index, even if
+            # its flag was cleared since, like the gelling point), None if outside the range
+            if not state[index]:
+                return 0
+            position = detection_positions[index]
+            if not 0 <= position < len(times):
+                return None
+            return int(np.searchsorted(selected, position))
+
+        return {
+            'stored_resistance': resistance[selected].tolist(),
+            'stored_temperature': temperature[selected].tolist(),
+            'stored_time': format_times(times[selected]),
+            'moving_average_resistance': [None if math.isnan(value) else value
+                                          for value in moving_average[selected].tolist()],
+            'sample_index': (selected + self.first_index + low).tolist(),
+            'lamp_turn_off_flag': state['lamp_turn_off_flag'],
+            'lamp_turn_off_index': remap('lamp_turn_off_index'),
+            'two_mins_earlier_lamp_turn_off_index': remap('two_mins_earlier_lamp_turn_off_index'),
+            'saturation_flag': state['saturation_flag'],
+            'saturation_index': remap('saturation_index'),
+            "geling_point_index": remap('geling_point_index'),
+            "gel_point_flag": state['gel_point_flag'],
+            'total_points': len(times),
+            'generation': self.generation
+        }
 
 
 # Define the Sensor_Data class
@@ -223,64 +1203,91 @@ class Sensor_Data:
     A class that represents sensor data.
 
     Attributes:
-        stored_temperature (list): A list to store temperature data.
-        stored_resistance (list): A list to store resistance data.
-        stored_times (list): A list to store the timestamps of the data.
+        stored_temperature (array): A column to store temperature data.
+        stored_resistance (array): A column to store resistance data.
+        stored_times (array): A column to store the timestamps of the data (seconds since the epoch).
         min_resistance (int): The minimum resistance value.
-        moving_average_resistance (list): A list to store the moving average of resistance data.
+        moving_average_resistance (array): A column to store the moving average of resistance data.
         lamp_turn_off_index (int): The index at which the lamp turns off.
         lamp_turn_off_flag (int): A flag indicating whether the lamp has turned off.
         geling_point_flag (int): A flag indicating whether the gelling point has been reached.
         geling_point_index (int): The index at which the gelling point is reached.
         two_mins_earlier_lamp_turn_off_index (int): The index at which the lamp turns off two minutes earlier.
-        slopes_after_geling_point (list): A list to store the slopes after the gelling point.
+        slopes_after_geling_point (array): A column to store the slopes after the gelling point.
         slopes_decreaing_after_gelling_point_flag (int): A flag indicating whether the slopes are decreasing after the gelling point.
         saturation_index (int): The index at which the resistance saturates.
         saturation_flag (int): A flag indicating whether the resistance has saturated.
+        moving_average_start_index (int): The sample index of the first moving average value.
+        slopes_start_index (int): The sample index of the first slope after the gelling point.
+        generation (int): A counter incremented on every reset, used to invalidate client cursors.
+        engine (CureSignalEngine): The streaming engine computing the moving average, slopes and detection flags.
+        config (CureConfig): The detection parameters of the current run.
+        max_samples (int): The number of samples kept in memory, or None to keep the whole run.
+        first_index (int): The sample index of the first value still kept in memory.
+        snapshot (DataSnapshot): The last published consistent view, read by the API without locking.
+        lock (threading.Lock): Serializes the writers (ingest and reset) of this pipeline.
+        sensor_id (str): The ID of the sensor feeding this pipeline.
+        run_log (RunLog): The on-disk log every sample and detection event is appended to, or None.
+        run_id (int): The ID of the current run in the run log.
 
     Methods:
-        reset_data(): Resets all the data lists and flags.
+        reset_data(config): Resets all the data lists and flags, optionally with new detection parameters.
         add_data(data): Adds new data to the respective lists and processes the input data.
         add_data_test(): Adds test data to the respective lists and processes the input data.
+        append_sample(temperature, resistance, timestamp): Appends a sample to the columns and processes it.
+        get_sample_count(): Returns the number of samples added since the last reset.
+        restore_run(run_id): Rebuilds the state of a logged run by replaying its samples.
         process_input_data(): Processes the input data and performs calculations on the data.
+        get_data_since(since): Returns the data appended since a given sample index.
+        get_detection_state(): Returns the current detection flags and indices.
+
+    Writers must hold `lock`. Readers go through `snapshot` (or the getters, which do).
     """
     
-    def __init__(self):
-        # Initialize the lists
-        self.stored_temperature = []
-        self.stored_resistance = []
-        self.stored_times = []
-        self.min_resistance = 0
-        self.moving_average_resistance = []
-        self.lamp_turn_off_index = 0
-        self.lamp_turn_off_flag = 0
-        self.geling_point_flag = 0
-        self.geling_point_index = 0
-        self.two_mins_earlier_lamp_turn_off_index = 0
-        self.slopes_after_geling_point = []
-        self.slopes_decreaing_after_gelling_point_flag = 0
-        self.saturation_index = 0
-        self.saturation_flag = 0
-
-    def reset_data(self):
+    def __init__(self, max_samples=MAX_STORED_SAMPLES, sensor_id=DEFAULT_SENSOR_ID, run_log=None, config=None):
+        self.max_samples = max_samples
+        self.config = config if config is not None else CureConfig()
+        self.lock = threading.Lock()
+        self.sensor_id = sensor_id
+        self.run_log = run_log
+        self.run_id = None
+        # Initialize the columns (reset_data moves the generation to 0)
+        self.generation = -1
+        self.reset_data()
+
+    def reset_data(self, config=None):
         """
         Resets all the data lists and flags.
+
+        Args:
+            config (CureConfig): The detection parameters of the new run, None to keep the current ones.
         """
-        # Reset the lists
-        self.stored_temperature = []
-        self.stored_resistance = []
-        self.stored_times = []
+        # Build the engine first, so a configuration it cannot run with leaves the pipeline untouched
+        engine = CureSignalEngine(config if config is not None else self.config)
+        self.config = engine.config
+        # Reset the columns
+        self.stored_temperature = array('d')
+        self.stored_resistance = array('d')
+        self.stored_times = array('d')
         self.min_resistance = 0
-        self.moving_average_resistance = []
+        self.moving_average_resistance = array('d')
         self.lamp_turn_off_index = 0
         self.lamp_turn_off_flag = 0
         self.geling_point_flag = 0
         self.geling_point_index = 0
         self.two_mins_earlier_lamp_turn_off_index = 0
-        self.slopes_after_geling_point = []
+        self.slopes_after_geling_point = array('d')
         self.slopes_decreaing_after_gelling_point_flag = 0
         self.saturation_index = 0
         self.saturation_flag = 0
+        self.moving_average_start_index = 0
+        self.slopes_start_index = 0
+        self.first_index = 0
+        self.engine = engine
+        self.generation += 1
+        if self.run_log is not None:
+            self.run_id = self.run_log.start_run(self.sensor_id, time.time(), self.config.to_dict())
+        self.snapshot = DataSnapshot(self)
 
     def add_data(self, data):
         """
@@ -293,14 +1300,9 @@ class Sensor_Data:
             bool: True if the data is successfully added and processed.
         """
         # Add the data to the respective lists
-        self.stored_temperature.append(data['temperature'])
-        self.stored_resistance.append(data['resistance'])
-        # stored time is in the format of YYYY-MM-DD HH:MM:SS AM/PM in as string
-        stored_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S %p")
-        self.stored_times.append(str(stored_time))
-        self.process_input_data()
-        return True
-        
+        temperature, resistance = parse_sample(data)
+        return self.append_sample(temperature, resistance, time.time())
+
     def add_data_test(self):
         """
         Adds test data to the respective lists and processes the input data.
@@ -313,90 +1315,439 @@ class Sensor_Data:
             global reader_index
             if start_read_flag:
                 data = reader[reader_index]
-                self.stored_temperature.append(float(data[2]))
-                self.stored_resistance.append(float(data[1]))
-                # stored time is in the format of YYYY-MM-DD HH:MM:SS AM/PM in as string
-                stored_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S %p")
-                self.stored_times.append(str(stored_time))
+                self.append_sample(float(data[2]), float(data[1]), time.time())
                 reader_index += 1
-                self.process_input_data()
                 return True
         except Exception as e:
             return jsonify({'message': 'Invalid data'}), 400
-        
-    def process_input_data(self):
+
+    def append_sample(self, temperature, resistance, timestamp):
         """
-        Processes the input data and performs calculations on the data.
+        Appends a sample to the columns and processes it.
+
+        The stored times never decrease (the time ranges of `get_history` and the thermal
+        join are binary searches), so a timestamp before the previous sample's is stored as
+        that one.
+
+        Args:
+            temperature (float): The temperature value.
+            resistance (float): The resistance value.
+            timestamp (float): The time of the sample in seconds since the epoch.
 
         Returns:
-            bool: True if the input data is successfully processed.
+            bool: True if the sample is successfully added and processed.
         """
-        # After MIN_LENGTH_OF_DATA datapoints, we start calculating the moving average of resistance datahistory
-        if len(self.stored_resistance) > MIN_LENGTH_OF_DATA:
-            # Calculate the moving average of the resistance data
-            moving_average_resistance = sum(
-                self.stored_resistance[-MOVING_AVERAGE_WINDOW:]) / MOVING_AVERAGE_WINDOW
-            self.moving_average_resistance.append(moving_average_resistance)
-
-            # THE NOISE IS REMOVED USING MOVING AVERAGE
-            # ON THE DENOISED DATA, WE CHECK WHETHER THE SLOPE IS POSITIVE OR NEGATIVE
-            # IF THE SLOPE IS POSITIVE, WE CHECK WHETHER IT WAS ALSO POSITIVE DELAY_LAMP_TURN_OFF DATA POINTS EARLIER
-            # IF IT WAS POSITIVE DELAY_LAMP_TURN_OFF DATA POINTS EARLIER, WE CONSIDER THAT THE GELING POINT HAS BEEN REACHED, SO WE SEND AN ALERT
-            if not self.lamp_turn_off_flag and len(self.moving_average_resistance) > int(DELAY_LAMP_TURN_OFF*FREQUENCY):
-                # Check if the slope is positive
-                if self.moving_average_resistance[-1] > self.moving_average_resistance[-2]:
-                    # Check if the slope was also positive int(DELAY_LAMP_TURN_OFF*FREQUENCY) data points earlier
-                    if self.moving_average_resistance[-(int(DELAY_LAMP_TURN_OFF*FREQUENCY))] > self.moving_average_resistance[-(int(DELAY_LAMP_TURN_OFF*FREQUENCY)+1)]:
-                        
-                        # Set the lamp turn off point index
-                        self.lamp_turn_off_index = len(
-                            self.stored_resistance) - 1
-                        self.two_mins_earlier_lamp_turn_off_index = len(
-                            self.stored_resistance) - 1 - int(DELAY_LAMP_TURN_OFF*FREQUENCY)
-                        self.lamp_turn_off_flag = 1
-
-            ### WE WANT TO FIND THE GELING POINT SEPERATELY FOR VISUALIZATION PURPOSES ONLY
-            if not self.lamp_turn_off_flag and len(self.moving_average_resistance) > int(DELAY_LAMP_TURN_OFF*FREQUENCY):
-            # Check if the slope is positive   
-                if self.moving_average_resistance[-1] > self.moving_average_resistance[-2]:
-                    if self.geling_point_flag == 0:
-                        self.geling_point_index = len(self.stored_resistance) - 1
-                    self.geling_point_flag = 1
-                else:
-                    self.geling_point_flag = 0
-            
-            # THE RESISTANCE WILL START TO INCREASE AFTER THE GELLING POINT, AND THEN AFTER SOME TIME IT SATURATES
-            # IF THE RESISTANCE IS SATURATED, WE RESET THE DATA
-            # THE SATURATED SLOPE IS 150 MEGAOHM PER MINUTE
-
-            # AFTER THE GELING POINT, WE START TO TRACK THE SLOPES
-            if self.lamp_turn_off_flag:
-                # Check the DENOISED DATA AND CALCULATE SLOPE ON THAT
-                slope = self.moving_average_resistance[-1] - \
-                    self.moving_average_resistance[-int(FREQUENCY*MOVING_AVERAGE_WINDOW)-1]
-                self.slopes_after_geling_point.append(slope)
-                if len(self.slopes_after_geling_point) > 2:
-                    # Check if the slope is decreasing
-                    if self.slopes_after_geling_point[-1] < self.slopes_after_geling_point[-2]:
-                        self.slopes_decreaing_after_gelling_point_flag = 1
-                if self.slopes_decreaing_after_gelling_point_flag:
-                    # Check if the slope is saturated
-                    if slope < 150 and not self.saturation_index:
-                        self.saturation_index = len(self.stored_resistance) - 1
-                        self.saturation_flag = 1
+        before = self.snapshot.detection_state
+        if self.stored_times and timestamp < self.stored_times[-1]:
+            timestamp = self.stored_times[-1]
+        self.stored_temperature.append(temperature)
+        self.stored_resistance.append(resistance)
+        self.stored_times.append(timestamp)
+        start = time.perf_counter()
+        self.process_input_data()
+        process_input_data_seconds.observe(time.perf_counter() - start, (self.sensor_id,))
+        if self.max_samples is not None and \
+                len(self.stored_resistance) >= self.max_samples + max(1, self.max_samples // 10):
+            self.drop_oldest_samples(len(self.stored_resistance) - self.max_samples)
+        self.snapshot = DataSnapshot(self)
+        if self.run_log is not None:
+            self.run_log.append_sample(self.run_id, self.snapshot.sample_count - 1, timestamp, temperature, resistance)
+            for event, flag, index in get_detection_events(before, self.snapshot.detection_state):
+                self.run_log.append_event(self.run_id, index, event, flag, timestamp)
         return True
 
+    def drop_oldest_samples(self, count):
+        """
+        Drops the oldest samples from memory once the retention limit is exceeded.
 
-# Create an instance of Sensor_Data
-sensor_data = Sensor_Data()
+        Samples are dropped in chunks of a tenth of the limit so the copy is amortized over
+        many appends. The detection indices stay absolute sample indices.
 
-# Define the POST endpoint
+        Args:
+            count (int): The number of samples to drop.
+        """
+        self.first_index += count
+        self.stored_temperature = self.stored_temperature[count:]
+        self.stored_resistance = self.stored_resistance[count:]
+        self.stored_times = self.stored_times[count:]
+        if self.moving_average_resistance:
+            dropped = max(0, self.first_index - self.moving_average_start_index)
+            self.moving_average_resistance = self.moving_average_resistance[dropped:]
+            self.moving_average_start_index += dropped
+        if self.slopes_after_geling_point:
+            dropped = max(0, self.first_index - self.slopes_start_index)
+            self.slopes_after_geling_point = self.slopes_after_geling_point[dropped:]
+            self.slopes_start_index += dropped
+
+    def get_sample_count(self):
+        """
+        Returns the number of samples added since the last reset.
+
+        Returns:
+            int: The number of samples, including the ones dropped by the retention limit.
+        """
+        return self.snapshot.sample_count
+
+    def restore_run(self, run_id):
+        """
+        Rebuilds the state of a logged run by replaying its samples through the pipeline.
+
+        Args:
+            run_id (int): The ID of the run in the run log.
+
+        Returns:
+            int: The number of samples replayed.
+        """
+        run_log = self.run_log
+        # Replayed samples are already in the log
+        self.run_log = None
+        try:
+            self.reset_data(CureConfig.from_dict(run_log.read_config(run_id)))
+            samples = run_log.read_samples(run_id)
+            for timestamp, temperature, resistance in samples:
+                self.append_sample(temperature, resistance, timestamp)
+        finally:
+            self.run_log = run_log
+        self.run_id = run_id
+        return len(samples)
+
+    def process_input_data(self):
+        """
+        Processes the input data and performs calculations on the data.
+
+        The calculations run in the streaming signal engine, which only sees the newest
+        resistance value; its results are appended to the history and its flags copied over.
+
+        Returns:
+            bool: True if the input data is successfully processed.
+        """
+        moving_average_resistance, slope = self.engine.update(self.stored_resistance[-1])
+        if moving_average_resistance is not None:
+            if not self.moving_average_resistance:
+                self.moving_average_start_index = self.engine.sample_count - 1
+            self.moving_average_resistance.append(moving_average_resistance)
+        if slope is not None:
+            if not self.slopes_after_geling_point:
+                self.slopes_start_index = self.engine.sample_count - 1
+            self.slopes_after_geling_point.append(slope)
+
+        engine = self.engine
+        self.lamp_turn_off_index = engine.lamp_turn_off_index
+        self.lamp_turn_off_flag = engine.lamp_turn_off_flag
+        self.geling_point_flag = engine.geling_point_flag
+        self.geling_point_index = engine.geling_point_index
+        self.two_mins_earlier_lamp_turn_off_index = engine.two_mins_earlier_lamp_turn_off_index
+        self.slopes_decreaing_after_gelling_point_flag = engine.slopes_decreaing_after_gelling_point_flag
+        self.saturation_index = engine.saturation_index
+        self.saturation_flag = engine.saturation_flag
+        return True
+
+    def get_data_since(self, since=0):
+        """
+        Returns the data appended since a given sample index, from the last published snapshot.
+
+        Args:
+            since (int): The number of samples the client already holds (0 for the full history).
+
+        Returns:
+            dict: The new part of every series along with the current detection flags and indices.
+        """
+        return self.snapshot.get_data_since(since)
+
+    def get_detection_state(self):
+        """
+        Returns the current detection flags and indices, from the last published snapshot.
+
+        Returns:
+            dict: The lamp turn off, gelling point and saturation flags along with their indices.
+        """
+        return dict(self.snapshot.detection_state)
+
+
+class SensorRegistry:
+    """
+    Keeps one independent Sensor_Data pipeline per sensor (one per infusion line).
+
+    Pipelines are created by the first sample or reset of a sensor, reads only look them up,
+    so polling an unknown ID never opens a run. Each one has its own lock, so samples of
+    different lines are processed concurrently while the samples of one line stay in order.
+
+    Attributes:
+        sensors (dict): The Sensor_Data pipelines by sensor ID.
+        run_log (RunLog): The run log shared by the pipelines, or None.
+        lock (threading.Lock): Guards the creation of pipelines.
+
+    Methods:
+        get(sensor_id): Returns the pipeline of a sensor, creating it if needed.
+        find(sensor_id): Returns the pipeline of a sensor, or None if it is unknown.
+        sensor_ids(): Returns the IDs of the known sensors.
+        restore_runs(): Rebuilds the pipelines of the runs in progress from the run log.
+    """
+
+    def __init__(self, run_log=None):
+        self.sensors = {}
+        self.run_log = run_log
+        self.lock = threading.Lock()
+
+    def get(self, sensor_id):
+        """
+        Returns the pipeline of a sensor, creating it if needed.
+
+        Args:
+            sensor_id (str): The ID of the sensor.
+
+        Returns:
+            Sensor_Data: The pipeline of the sensor.
+        """
+        sensor_data = self.sensors.get(sensor_id)
+        if sensor_data is None:
+            with self.lock:
+                if sensor_id not in self.sensors:
+                    self.sensors[sensor_id] = Sensor_Data(sensor_id=sensor_id, run_log=self.run_log)
+                sensor_data = self.sensors[sensor_id]
+        return sensor_data
+
+    def find(self, sensor_id):
+        """
+        Returns the pipeline of a sensor, without creating it.
+
+        Args:
+            sensor_id (str): The ID of the sensor.
+
+        Returns:
+            Sensor_Data: The pipeline of the sensor, or None if it is unknown.
+        """
+        return self.sensors.get(sensor_id)
+
+    def sensor_ids(self):
+        """
+        Returns the IDs of the known sensors.
+
+        Returns:
+            list: The sensor IDs.
+        """
+        with self.lock:
+            return list(self.sensors)
+
+    def restore_runs(self):
+        """
+        Rebuilds the pipelines of the runs in progress from the run log, e.g. after a restart mid-cure.
+        """
+        if self.run_log is None:
+            return
+        for sensor_id, run_id in self.run_log.open_runs().items():
+            sensor_data = Sensor_Data(sensor_id=sensor_id)
+            sensor_data.run_log = self.run_log
+            count = sensor_data.restore_run(run_id)
+            with self.lock:
+                self.sensors[sensor_id] = sensor_data
+            print(f"Restored run {run_id} of sensor {sensor_id} ({count} samples)")
+
+
+# Open the run log and rebuild the runs in progress
+run_log = RunLog(RUN_LOG_PATH) if RUN_LOG_PATH else None
+if run_log is not None:
+    atexit.register(run_log.close)
+
+# Create the registry of Sensor_Data pipelines
+sensors = SensorRegistry(run_log)
+sensors.restore_runs()
+# The default sensor always exists, so single-line setups can poll before the first sample
+sensors.get(DEFAULT_SENSOR_ID)
+
+
+def unknown_sensor(sensor_id):
+    """
+    Returns the response to a read of a sensor that never sent a sample.
+
+    Args:
+        sensor_id (str): The ID of the sensor.
+
+    Returns:
+        tuple: A JSON error message and HTTP status code 404.
+    """
+    return jsonify({'message': f'Unknown sensor: {sensor_id}'}), 404
+
+
+def get_sensor_id(data=None):
+    """
+    Returns the sensor ID a request refers to.
+
+    The ID is read from the 'sensor_id' query parameter, then from the JSON body, and
+    defaults to DEFAULT_SENSOR_ID so single-line setups keep working unchanged.
+
+    Args:
+        data (dict, optional): The JSON body of the request.
+
+    Returns:
+        str: The sensor ID.
+    """
+    sensor_id = request.args.get('sensor_id')
+    if sensor_id is None and isinstance(data, dict):
+        sensor_id = data.get('sensor_id')
+    return str(sensor_id) if sensor_id is not None else DEFAULT_SENSOR_ID
+
+
+STREAM_KEEP_ALIVE = 15  # Seconds
+CLOSE_STREAM = None  # Pushed to a dropped listener to end its stream
+
+
+class MessageAnnouncer:
+    """
+    Fans server-sent events out to every client subscribed to a sensor.
+
+    Each message is formatted once and handed to every listener queue of the sensor. A listener
+    that cannot keep up (its queue is full) is dropped, so a stalled client never slows down
+    ingest: its backlog is discarded and replaced by CLOSE_STREAM, which ends its response, so
+    the client reconnects and catches up through the snapshot sent on subscription.
+
+    Attributes:
+        listeners (dict): The queues of the subscribed clients, by sensor ID.
+        max_queued (int): The number of messages a listener may lag behind before it is dropped.
+        lock (threading.Lock): Guards the listeners.
+
+    Methods:
+        listen(sensor_id): Subscribes a new listener to a sensor and returns its queue.
+        unlisten(sensor_id, listener): Unsubscribes a listener.
+        announce(sensor_id, event, data): Formats a message and pushes it to every listener of a sensor.
+    """
+
+    def __init__(self, max_queued=100):
+        self.listeners = {}
+        self.max_queued = max_queued
+        self.lock = threading.Lock()
+
+    def listen(self, sensor_id):
+        """
+        Subscribes a new listener to a sensor.
+
+        Args:
+            sensor_id (str): The ID of the sensor.
+
+        Returns:
+            queue.Queue: The queue the formatted messages are pushed to.
+        """
+        listener = queue.Queue(maxsize=self.max_queued)
+        with self.lock:
+            self.listeners.setdefault(sensor_id, []).append(listener)
+        return listener
+
+    def unlisten(self, sensor_id, listener):
+        """
+        Unsubscribes a listener.
+
+        Args:
+            sensor_id (str): The ID of the sensor.
+            listener (queue.Queue): The queue returned by `listen`.
+        """
+        with self.lock:
+            listeners = self.listeners.get(sensor_id, [])
+            if listener in listeners:
+                listeners.remove(listener)
+
+    def announce(self, sensor_id, event, data):
+        """
+        Formats a message and pushes it to every listener of a sensor.
+
+        Args:
+            sensor_id (str): The ID of the sensor.
+            event (str): The name of the event.
+            data (dict): The JSON serializable payload of the event.
+        """
+        with self.lock:
+            listeners = self.listeners.get(sensor_id)
+            if not listeners:
+                return
+            message = format_sse(event, data)
+            for listener in list(listeners):
+                try:
+                    listener.put_nowait(message)
+                except queue.Full:
+                    listeners.remove(listener)
+                    drop_listener(listener)
+
+
+def drop_listener(listener):
+    """
+    Discards the backlog of a dropped listener and tells its stream to end.
+
+    Args:
+        listener (queue.Queue): The queue of the listener, already unsubscribed.
+    """
+    try:
+        while True:
+            listener.get_nowait()
+    except queue.Empty:
+        pass
+    listener.put_nowait(CLOSE_STREAM)
+
+
+def format_sse(event, data):
+    """
+    Formats a server-sent event.
+
+    Args:
+        event (str): The name of the event.
+        data (dict): The JSON serializable payload of the event.
+
+    Returns:
+        str: The event in the text/event-stream format.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def announce_new_sample(sensor_id, sensor_data, before):
+    """
+    Pushes the last added sample and the detection flags that changed with it.
+
+    Args:
+        sensor_id (str): The ID of the sensor.
+        sensor_data (Sensor_Data): The pipeline the sample was added to.
+        before (dict): The detection state before the sample was added.
+    """
+    after = sensor_data.get_detection_state()
+    announcer.announce(sensor_id, 'sample', sensor_data.get_data_since(sensor_data.get_sample_count() - 1))
+    for event, flag, index in get_detection_events(before, after):
+        announcer.announce(sensor_id, event, {'flag': flag, 'index': index})
+
+
+announcer = MessageAnnouncer()
+
+
+def announce_hotspots(regions, stats):
+    """
+    Announces the thermal regions that just became hotspots to the listeners of the thermal sensor.
+
+    Args:
+        regions (list): The (row, column) of the new hotspot regions.
+        stats (dict): The statistics of the analysis that found them.
+    """
+    sensor_data = sensors.find(THERMAL_SENSOR_ID)
+    announcer.announce(THERMAL_SENSOR_ID, 'hotspot', {
+        'regions': [list(region) for region in regions],
+        'max': [float(stats['max'][region]) for region in regions],
+        'hotspot_area': [float(stats['hotspot_area'][region]) for region in regions],
+        'sample_index': sensor_data.snapshot.sample_count if sensor_data is not None else 0,
+        'time': time.time(),
+    })
+
+
+# Analyze the thermal camera in the background once /api/thermal sets a rate (off by default),
+# it keeps the camera open while running
+thermal_series = ThermalSeries(max_analyses=MAX_STORED_SAMPLES)
+thermal_monitor = ThermalMonitor(camera_th, ThermalAnalyzer(), thermal_series, on_start=broadcaster_th.hold,
+                                 on_stop=broadcaster_th.release, on_hotspot=announce_hotspots)
+
+# Define the POST endpoint
 
 @app.route('/api/add_data', methods=['POST'])
 def post_data():
     """
     Adds the data received from the request to the respective lists.
 
+    The sample goes to the pipeline of the 'sensor_id' given in the query string or the
+    JSON body (DEFAULT_SENSOR_ID if omitted).
+
     Returns:
         A JSON response indicating the success or failure of adding the data.
 
@@ -406,24 +1757,108 @@ def post_data():
     Example Usage:
         response = post_data()
     """
+    start = time.perf_counter()
     # Get the data from the request
     try:
         data = request.get_json()
+        # Validate the whole sample first, so an invalid one appends nothing
+        temperature, resistance = parse_sample(data)
     except Exception as e:
         print(e)
         return jsonify({'message': 'Invalid data'}), 400
     # Add the data to the respective lists
-    sensor_data.add_data(data)
+    sensor_id = get_sensor_id(data)
+    sensor_data = sensors.get(sensor_id)
+    with sensor_data.lock:
+        before = sensor_data.get_detection_state()
+        sensor_data.append_sample(temperature, resistance, time.time())
+        announce_new_sample(sensor_id, sensor_data, before)
+    add_data_seconds.observe(time.perf_counter() - start, ('add_data',))
 
     # Return a success message
     return jsonify({'message': 'Data added successfully'}), 200
 
 
+def ingest_samples(sensor_id, samples):
+    """
+    Processes a batch of samples of one sensor in order, under a single lock acquisition.
+
+    Args:
+        sensor_id (str): The ID of the sensor.
+        samples (list): The (temperature, resistance, timestamp) tuples, timestamps in seconds since the epoch.
+
+    Returns:
+        tuple: The 'next_index' of the sensor and the (event, flag, index) detection events fired by the batch.
+    """
+    sensor_data = sensors.get(sensor_id)
+    events = []
+    with sensor_data.lock:
+        first_index = sensor_data.get_sample_count()
+        for temperature, resistance, timestamp in samples:
+            before = sensor_data.snapshot.detection_state
+            sensor_data.append_sample(temperature, resistance, timestamp)
+            events.extend(get_detection_events(before, sensor_data.snapshot.detection_state))
+        next_index = sensor_data.get_sample_count()
+        if samples:
+            # The whole batch goes out as one delta
+            announcer.announce(sensor_id, 'sample', sensor_data.get_data_since(first_index))
+            for event, flag, index in events:
+                announcer.announce(sensor_id, event, {'flag': flag, 'index': index})
+    return next_index, events
+
+
+@app.route('/api/add_data_batch', methods=['POST'])
+def post_data_batch():
+    """
+    Adds a batch of timestamped samples received from the request, in order.
+
+    The request body is a JSON object with the 'sensor_id' (DEFAULT_SENSOR_ID if omitted) and
+    a list of 'samples', each with 'temperature', 'resistance' and optionally 'timestamp' (the
+    sensor time in seconds since the epoch, arrival time if omitted). The whole batch is
+    validated first (finite temperatures and resistances, timestamps `datetime` can represent)
+    and then processed in one pass under a single lock acquisition, so it is suited to
+    backfills, high-rate sensors and replaying a collector outage. An invalid sample rejects
+    the whole batch with a 400, before anything is added. A timestamp before the previous
+    sample's (a clock step back) is stored as that one, so the stored times never decrease.
+
+    Returns:
+        A JSON response with the number of samples added, the 'next_index' of the sensor and
+        the detection 'events' fired by the batch (event, flag and index), or an error message.
+    """
+    start = time.perf_counter()
+    try:
+        data = request.get_json()
+        now = time.time()
+        samples = [parse_sample(sample) + (parse_timestamp(sample.get('timestamp', now)),)
+                   for sample in data['samples']]
+    except Exception as e:
+        print(e)
+        return jsonify({'message': 'Invalid data'}), 400
+    next_index, events = ingest_samples(get_sensor_id(data), samples)
+    add_data_seconds.observe(time.perf_counter() - start, ('add_data_batch',))
+    return jsonify({
+        'message': 'Data added successfully',
+        'count': len(samples),
+        'next_index': next_index,
+        'events': [{'event': event, 'flag': flag, 'index': index} for event, flag, index in events]
+    }), 200
+
+
 @app.route('/api/get_data', methods=['GET'])
 def get_data():
     """
     Retrieves the stored resistance data along with other related information.
 
+    Query Parameters:
+        sensor_id (str, optional): The sensor to read (DEFAULT_SENSOR_ID if omitted).
+        since (int, optional): The 'next_index' of the previous response. Only the points appended
+            after it are returned. Omit it to get the full history on first load.
+        generation (int, optional): The 'generation' of the previous response. If the data was reset
+            in the meantime, the full history is returned instead of a delta.
+        thermal (str, optional): '1' to return the thermal statistics of THERMAL_SENSOR_ID even
+            before the first analysis of the run.
+        regions (str, optional): '1' to also return the thermal statistics of every region.
+
     Returns:
         A JSON response containing the following data:
         - 'stored_resistance': The stored resistance values.
@@ -438,42 +1873,250 @@ def get_data():
         - 'slopes': The slopes of the resistance values after the geling point.
         - 'geling_point_index': The index at which the geling point is detected.
         - 'gel_point_flag': The flag indicating if the geling point is detected.
+        - 'since': The sample index the series start at (0 for a full snapshot).
+        - 'next_index': The value to pass as 'since' on the next poll.
+        - 'generation': The value to pass as 'generation' on the next poll.
+        - 'thermal': For THERMAL_SENSOR_ID, once the run has a thermal analysis (or with
+          'thermal=1'), the thermal statistics in force at every returned sample (see
+          ThermalSeries.align), per region too with 'regions=1'.
 
     HTTP Status Code:
         200 (OK) - The request was successful.
+        404 (Not Found) - The sensor is unknown.
     """
     # Return the stored resistance list
     # sensor_data.add_data_test() # For test purposes
+    start = time.perf_counter()
+    sensor_id = get_sensor_id()
+    sensor_data = sensors.find(sensor_id)
+    if sensor_data is None:
+        return unknown_sensor(sensor_id)
+    snapshot = sensor_data.snapshot
+    since = request.args.get('since', default=0, type=int)
+    generation = request.args.get('generation', type=int)
+    # Fall back to a full snapshot when the client cursor is stale (data reset or out of range)
+    if since < 0 or since > snapshot.sample_count or \
+            (generation is not None and generation != snapshot.generation):
+        since = 0
+    data = snapshot.get_data_since(since)
+    # Without an analysis the statistics would all be null, so they are left out unless asked for
+    if sensor_id == THERMAL_SENSOR_ID and (thermal_series.get_count() or request.args.get('thermal') == '1'):
+        times = snapshot.columns[2][data['since'] - snapshot.first_index:snapshot.sample_count - snapshot.first_index]
+        data['thermal'] = thermal_series.align(times, regions=request.args.get('regions') == '1')
+    response = jsonify(data)
+    get_data_seconds.observe(time.perf_counter() - start)
+    get_data_bytes.inc(amount=response.content_length or 0)
+    return response, 200
+
+
+@app.route('/api/get_history', methods=['GET'])
+def get_history():
+    """
+    Retrieves a time range of a run, downsampled for charting.
+
+    Query Parameters:
+        sensor_id (str, optional): The sensor to read (DEFAULT_SENSOR_ID if omitted).
+        start (float, optional): The start of the range in seconds since the epoch (start of the run if omitted).
+        end (float, optional): The end of the range in seconds since the epoch (last sample if omitted).
+        points (int, optional): The approximate number of points to return (HISTORY_POINTS if omitted).
+        mode (str, optional): 'lttb' (default) or 'minmax'.
+
+    Returns:
+        A JSON response containing the downsampled 'stored_resistance', 'stored_temperature',
+        'stored_time' and 'moving_average_resistance' (null before it starts), the original
+        'sample_index' of every point, the detection flags with their indices remapped to the
+        returned series (null if outside the range), and the number of points in the range.
+
+    HTTP Status Code:
+        200 (OK) - The request was successful.
+        400 (Bad Request) - The parameters are invalid.
+        404 (Not Found) - The sensor is unknown.
+    """
+    sensor_id = get_sensor_id()
+    sensor_data = sensors.find(sensor_id)
+    if sensor_data is None:
+        return unknown_sensor(sensor_id)
+    snapshot = sensor_data.snapshot
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    points = request.args.get('points', default=HISTORY_POINTS, type=int)
+    mode = request.args.get('mode', default='lttb')
+    if points < 10 or mode not in ('lttb', 'minmax'):
+        return jsonify({'message': 'Invalid parameters'}), 400
+    return jsonify(snapshot.get_history(start, end, points, mode)), 200
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream():
+    """
+    Streams the sensor samples and cure events of one sensor (the 'sensor_id' query
+    parameter, DEFAULT_SENSOR_ID if omitted) to the client as server-sent events.
+
+    The stream starts with a 'snapshot' event holding the full history (same payload as
+    `/api/get_data`), followed by:
+        - 'sample': Every new sample, in the same format as a `/api/get_data?since=` delta.
+        - 'lamp_turn_off', 'gel_point', 'saturation': A detection flag changed, with its new value and index.
+        - 'reset': The data was reset.
+
+    Returns:
+        Response: A text/event-stream response, or 404 if the sensor is unknown.
+    """
+    sensor_id = get_sensor_id()
+    sensor_data = sensors.find(sensor_id)
+    if sensor_data is None:
+        return unknown_sensor(sensor_id)
+    listener = announcer.listen(sensor_id)
+    snapshot = format_sse('snapshot', sensor_data.get_data_since(0))
+
+    def generate():
+        try:
+            yield snapshot
+            while True:
+                try:
+                    message = listener.get(timeout=STREAM_KEEP_ALIVE)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                # The client fell too far behind, ending the response makes it reconnect
+                if message is CLOSE_STREAM:
+                    return
+                yield message
+        finally:
+            announcer.unlisten(sensor_id, listener)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/sensors', methods=['GET'])
+def list_sensors():
+    """
+    Lists the sensors known to the API.
+
+    Returns:
+        A JSON response with, for every sensor, its ID, number of samples and detection state.
+    """
+    sensor_list = []
+    for sensor_id in sensors.sensor_ids():
+        snapshot = sensors.get(sensor_id).snapshot
+        sensor_list.append(dict(sensor_id=sensor_id, sample_count=snapshot.sample_count,
+                                config=sensors.get(sensor_id).config.to_dict(), **snapshot.detection_state))
+    return jsonify({'sensors': sensor_list}), 200
+
+
+def run_log_state():
+    """
+    Returns the state of the run log.
+
+    Returns:
+        str: 'disabled', 'ok', or 'stopped' if its writer thread exited.
+    """
+    if run_log is None:
+        return 'disabled'
+    return 'ok' if run_log.thread.is_alive() else 'stopped'
+
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """
+    Reports the state of the API and of the cameras.
+
+    Answers as soon as the API is up, whatever the state of the cameras; they are only opened
+    while someone watches them.
+
+    Returns:
+        A JSON response with the uptime, number of sensors, run log state and, for every camera,
+        its state ('closed', 'connecting', 'streaming', 'reconnecting' or 'restarting'), seconds
+        since its last frame and counters, and HTTP status code 200.
+    """
     return jsonify({
-        'stored_resistance': sensor_data.stored_resistance,
-        'stored_temperature': sensor_data.stored_temperature,
-        'stored_time': sensor_data.stored_times, 
-        'lamp_turn_off_flag': sensor_data.lamp_turn_off_flag,
-        'lamp_turn_off_index': sensor_data.lamp_turn_off_index,
-        'two_mins_earlier_lamp_turn_off_index': sensor_data.two_mins_earlier_lamp_turn_off_index,
-        'saturation_flag': sensor_data.saturation_flag,
-        'saturation_index': sensor_data.saturation_index,
-        'moving_average_resistance': sensor_data.moving_average_resistance,
-        'slopes': sensor_data.slopes_after_geling_point,
-        "geling_point_index": sensor_data.geling_point_index,
-        "gel_point_flag": sensor_data.geling_point_flag
+        'status': 'ok',
+        'uptime': time.time() - api_start_time,
+        'sensors': len(sensors.sensor_ids()),
+        'run_log': run_log_state(),
+        'cameras': [camera.get_status() for camera in cameras],
+        'thermal_analysis': {'rate': thermal_monitor.rate, 'analyses': thermal_monitor.analyses},
+    }), 200
+
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """
+    Tells whether the sensor API can ingest and serve data.
+
+    The cameras are not part of readiness, a camera being down never holds back ingest.
+
+    Returns:
+        A JSON response with the run log state, and HTTP status code 200, or 503 if the run
+        log stopped writing.
+    """
+    state = run_log_state()
+    return jsonify({'ready': state != 'stopped', 'run_log': state}), 200 if state != 'stopped' else 503
+
+
+@app.route('/api/thermal', methods=['GET'])
+def thermal():
+    """
+    Returns the latest thermal analysis and optionally changes the analysis rate.
+
+    Query Parameters:
+        rate (float, optional): The number of thermal frames analyzed per second, 0 to pause
+            the analysis (and let the thermal camera close when nobody watches it), otherwise
+            between THERMAL_MIN_RATE and THERMAL_MAX_RATE.
+
+    Returns:
+        A JSON response with the rate, number of frames analyzed, sensor the analysis is
+        aligned with, and the per-region statistics and hotspots of the last analysis (None
+        before the first one), and HTTP status code 200, or 400 if the rate is invalid.
+    """
+    if 'rate' in request.args:
+        rate = request.args.get('rate', type=float)
+        if rate is None:
+            return jsonify({'message': 'rate must be a number of frames per second, 0 to pause'}), 400
+        try:
+            thermal_monitor.set_rate(rate)
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+    return jsonify({
+        'rate': thermal_monitor.rate,
+        'analyses': thermal_monitor.analyses,
+        'sensor_id': THERMAL_SENSOR_ID,
+        'latest': thermal_series.get_latest(),
     }), 200
 
 
 @app.route('/api/reset_data', methods=['GET'])
 def reset_data():
     """
-    Resets the stored data and sets the video frames to the beginning.
+    Resets the stored data of a sensor (the 'sensor_id' query parameter, DEFAULT_SENSOR_ID
+    if omitted) and sets the video frames to the beginning.
+
+    The detection parameters of the new run can be changed with query parameters named after
+    the CureConfig attributes (e.g. '?moving_average_window=20&saturation_slope=120'); the ones
+    omitted keep their current value.
 
     Returns:
-        A JSON response with a success message and HTTP status code 200.
+        A JSON response with a success message and the parameters of the new run, and HTTP status
+        code 200, or 400 if a parameter is invalid.
     """
     global start_read_flag
+    sensor_id = get_sensor_id()
+    sensor_data = sensors.get(sensor_id)
+    config = None
+    if any(name in request.args for name in CureConfig.PARAMETERS):
+        try:
+            config = CureConfig.from_dict({**sensor_data.config.to_dict(), **request.args.to_dict()})
+        except ValueError as e:
+            return jsonify({'message': f'Invalid detection parameters: {e}'}), 400
     start_read_flag = 1
-    sensor_data.reset_data()
-    video1.set(cv2.CAP_PROP_POS_FRAMES, 0)
-    video2.set(cv2.CAP_PROP_POS_FRAMES, 0)
-    return jsonify({'message': 'Data reset successfully'}), 200
+    with sensor_data.lock:
+        sensor_data.reset_data(config)
+        announcer.announce(sensor_id, 'reset', {'generation': sensor_data.generation})
+    if sensor_id == THERMAL_SENSOR_ID:
+        thermal_series.reset()
+    movie.rewind()
+    movie_th.rewind()
+    return jsonify({'message': 'Data reset successfully', 'config': sensor_data.config.to_dict()}), 200
 
 @app.route('/api/init_sensor_data', methods=['GET'])
 def init_sensor_data():
@@ -484,18 +2127,256 @@ def init_sensor_data():
     Returns:
         A JSON response containing a success message and HTTP status code 200.
     """
-    sensor_data.reset_data()
+    sensor_data = sensors.get(DEFAULT_SENSOR_ID)
+    with sensor_data.lock:
+        sensor_data.reset_data()
     global reader
     global reader_index
     global start_read_flag
     start_read_flag = 0
     reader_index = 0
-    txt_data_dir = "../Data_to_use/09.04_test1/optimold_c_716_240409_144515.txt"
+    txt_data_dir = TEST_DATA_PATH
     with open(txt_data_dir, 'r') as file:
         reader = list(csv.reader(file, delimiter=','))
 
     return jsonify({'message': 'Sensor Data initialized successfully'}), 200
 
+
+def resolve_run(name):
+    """
+    Returns the path of a recorded run from its name, only if it lies inside RUNS_DIRECTORY.
+
+    Args:
+        name (str): The path of the run relative to RUNS_DIRECTORY.
+
+    Returns:
+        str: The resolved path of the run.
+
+    Raises:
+        ValueError: If the name leads outside RUNS_DIRECTORY (absolute path, '..' or a link)
+        or is not a recorded run file.
+    """
+    directory = os.path.realpath(RUNS_DIRECTORY)
+    path = os.path.realpath(os.path.join(directory, name))
+    if os.path.commonpath((directory, path)) != directory or not path.endswith(RUN_EXTENSIONS):
+        raise ValueError(f"Invalid run: {name}")
+    return path
+
+
+@app.route('/api/replay/start', methods=['GET'])
+def start_replay():
+    """
+    Replays a recorded run and its videos from one clock, through the normal ingest path.
+
+    The sensor ('sensor_id', DEFAULT_SENSOR_ID if omitted) is reset and the run ('run', its path
+    relative to RUNS_DIRECTORY, TEST_DATA_PATH if omitted) is fed to it at 'speed' times real
+    time (1 if omitted, 'max' for as fast as possible). Runs outside RUNS_DIRECTORY are refused. /api/test_movie and /api/test_movie_th follow the replay clock while
+    the replay runs. A replay already running is stopped first.
+
+    Returns:
+        A JSON response with the status of the replay and HTTP status code 200, or 400 if the
+        speed or the run is invalid or the run cannot be read.
+    """
+    global replay
+    speed = request.args.get('speed', '1')
+    try:
+        speed = None if speed == 'max' else float(speed)
+        if speed is not None and not speed > 0:
+            raise ValueError(speed)
+    except ValueError:
+        return jsonify({'message': "Invalid speed, expected a positive number or 'max'"}), 400
+    try:
+        path = resolve_run(request.args.get('run', os.path.relpath(TEST_DATA_PATH, RUNS_DIRECTORY)))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    sensor_id = get_sensor_id()
+    sensor_data = sensors.get(sensor_id)
+    with replay_lock:
+        if replay is not None:
+            replay.stop()
+        try:
+            new_replay = Replay(path, speed, sensor_data.config.frequency,
+                                lambda samples: ingest_samples(sensor_id, samples),
+                                (replay_video, replay_video_th))
+        except OSError as e:
+            replay = None
+            return jsonify({'message': f'Unable to read the run: {e}'}), 400
+        with sensor_data.lock:
+            sensor_data.reset_data()
+            announcer.announce(sensor_id, 'reset', {'generation': sensor_data.generation})
+        replay = new_replay
+        replay.start()
+        return jsonify(replay.get_status()), 200
+
+
+@app.route('/api/replay/stop', methods=['GET'])
+def stop_replay():
+    """
+    Stops the running replay; its viewers keep the last frame, new viewers of the test videos
+    get them in real time again.
+
+    Returns:
+        A JSON response with the status of the stopped replay and HTTP status code 200, or 404
+        if no replay was started.
+    """
+    with replay_lock:
+        if replay is None:
+            return jsonify({'message': 'No replay started'}), 404
+        replay.stop()
+        return jsonify(replay.get_status()), 200
+
+
+@app.route('/api/replay/status', methods=['GET'])
+def replay_status():
+    """
+    Returns the progress of the last replay.
+
+    Returns:
+        A JSON response with the path, speed, recording time reached ('position', seconds),
+        samples ingested and total, and whether it finished, or 404 if no replay was started.
+    """
+    current = replay
+    if current is None:
+        return jsonify({'message': 'No replay started'}), 404
+    return jsonify(current.get_status()), 200
+
+def collect_sensor_gauges(value):
+    """
+    Returns a value computed from the snapshot of every sensor, for a gauge.
+
+    Args:
+        value (callable): Computes the value from a DataSnapshot.
+
+    Returns:
+        dict: The values by (sensor_id,).
+    """
+    return {(sensor_id,): value(sensors.get(sensor_id).snapshot) for sensor_id in sensors.sensor_ids()}
+
+
+def collect_open_streams():
+    """
+    Returns the number of open MJPEG streams, for a gauge.
+
+    Returns:
+        dict: The numbers by (stream,).
+    """
+    with open_streams_lock:
+        return {(stream,): count for stream, count in open_streams.items()}
+
+
+def collect_sse_listeners():
+    """
+    Returns the number of server-sent event listeners, for a gauge.
+
+    Returns:
+        dict: The numbers by (sensor_id,).
+    """
+    with announcer.lock:
+        return {(sensor_id,): len(listeners) for sensor_id, listeners in announcer.listeners.items()}
+
+
+metrics.gauge('exofuse_history_samples', "Samples of the current run held in memory.",
+              lambda: collect_sensor_gauges(lambda snapshot: snapshot.sample_count - snapshot.first_index),
+              ('sensor_id',))
+metrics.gauge('exofuse_run_samples', "Samples of the current run, including the ones dropped from memory.",
+              lambda: collect_sensor_gauges(lambda snapshot: snapshot.sample_count), ('sensor_id',))
+metrics.callback_counter('exofuse_camera_frames_total', "Frames retrieved (decoded) from a camera.",
+                         lambda: {(camera.name,): camera.frames_retrieved for camera in cameras}, ('camera',))
+metrics.callback_counter('exofuse_camera_read_failures_total',
+                         "Failed reads from a camera, each followed by a reconnect.",
+                         lambda: {(camera.name,): camera.read_failures for camera in cameras}, ('camera',))
+metrics.callback_counter('exofuse_thermal_analyses_total', "Thermal frames analyzed.",
+                         lambda: thermal_monitor.analyses)
+metrics.gauge('exofuse_thermal_hotspots', "Thermal regions currently hotspots.",
+              lambda: len(thermal_series.hotspots))
+metrics.gauge('exofuse_mjpeg_streams', "Open MJPEG streams.", collect_open_streams, ('stream',))
+metrics.gauge('exofuse_sse_listeners', "Open server-sent event streams.", collect_sse_listeners, ('sensor_id',))
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Returns the metrics of the API in the Prometheus text format.
+
+    Returns:
+        A text response with the metrics and HTTP status code 200.
+    """
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8'), 200
+
+
+# Per-request timing and profiling, switched on at runtime through /api/profiling
+request_timing = False
+request_profiling = False
+# Only one request is profiled at a time, the others run unprofiled
+profiler_lock = threading.Lock()
+profile_stats = None
+profile_stats_lock = threading.Lock()
+
+
+@app.before_request
+def start_request_hooks():
+    """
+    Starts the timer and the profiler of a request when they are switched on.
+    """
+    if request_timing:
+        g.request_start = time.perf_counter()
+    if request_profiling and profiler_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+@app.teardown_request
+def stop_request_hooks(exception=None):
+    """
+    Records the time and the profile of a request, if they were started.
+    """
+    global profile_stats
+    start = g.pop('request_start', None)
+    if start is not None:
+        request_seconds.observe(time.perf_counter() - start, (request.endpoint or 'unknown', request.method))
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profiler_lock.release()
+        with profile_stats_lock:
+            if profile_stats is None:
+                profile_stats = pstats.Stats(profiler)
+            else:
+                profile_stats.add(profiler)
+
+
+@app.route('/api/profiling', methods=['GET'])
+def profiling():
+    """
+    Switches the per-request timing and profiling on or off and returns the collected profile.
+
+    Query Parameters:
+        timing (str, optional): 'on' to record the time of every request in 'exofuse_request_seconds', 'off' to stop.
+        profile (str, optional): 'on' to profile the requests with cProfile, 'off' to stop.
+        reset (str, optional): '1' to clear the collected profile.
+        limit (int, optional): The number of functions listed in the profile (30 by default).
+
+    Returns:
+        A JSON response with the state of the hooks and the profile sorted by cumulative time,
+        and HTTP status code 200.
+    """
+    global request_timing, request_profiling, profile_stats
+    if 'timing' in request.args:
+        request_timing = request.args['timing'] == 'on'
+    if 'profile' in request.args:
+        request_profiling = request.args['profile'] == 'on'
+    with profile_stats_lock:
+        if request.args.get('reset') == '1':
+            profile_stats = None
+        report = ''
+        if profile_stats is not None:
+            output = io.StringIO()
+            profile_stats.stream = output
+            profile_stats.sort_stats('cumulative').print_stats(request.args.get('limit', default=30, type=int))
+            report = output.getvalue()
+    return jsonify({'timing': request_timing, 'profile': request_profiling, 'report': report}), 200
+
+
 ########################
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, threaded=True)
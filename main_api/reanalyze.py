@@ -0,0 +1,333 @@
+import argparse
+import csv
+import math
+import os
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from signal_engine import CureSignalEngine, CureConfig
+
+
+RUN_EXTENSIONS = ('.txt', '.csv')
+# Windows whose values span more binary orders of magnitude than this are summed with math.fsum,
+# beyond it the double-double sum below is not guaranteed to be exact
+MAX_EXACT_EXPONENT_SPAN = 40
+
+
+def load_run(path):
+    """
+    Loads a recorded run (the optimold export read by /api/init_sensor_data).
+
+    Rows whose resistance or temperature is not a number (e.g. headers) are skipped.
+
+    Args:
+        path (str): The path of the recorded run.
+
+    Returns:
+        tuple: The resistance and temperature columns as numpy arrays.
+    """
+    resistance = []
+    temperature = []
+    with open(path, 'r') as file:
+        for row in csv.reader(file, delimiter=','):
+            try:
+                resistance_value, temperature_value = float(row[1]), float(row[2])
+            except (IndexError, ValueError):
+                continue
+            resistance.append(resistance_value)
+            temperature.append(temperature_value)
+    return np.array(resistance, dtype=np.float64), np.array(temperature, dtype=np.float64)
+
+
+def window_sums(values, window):
+    """
+    Computes the sum of every window of a series, correctly rounded like the streaming engine.
+
+    The windows are summed column by column in double-double arithmetic (TwoSum), which is
+    exact as long as the values of a window span less than MAX_EXACT_EXPONENT_SPAN binary
+    orders of magnitude; the rare windows beyond that are summed with math.fsum. Like the
+    engine's RollingSum, infinities and NaNs are left out of the sum and only decide the
+    result of the windows that contain them.
+
+    Args:
+        values (numpy.ndarray): The series, already padded so that every window is full.
+        window (int): The number of values per window.
+
+    Returns:
+        numpy.ndarray: The sum of every window, len(values) - window + 1 values.
+    """
+    finite = np.isfinite(values)
+    if not finite.all():
+        return with_non_finite(window_sums(np.where(finite, values, 0.0), window), values, window)
+    windows = sliding_window_view(values, window)
+    high = np.zeros(len(windows))
+    low = np.zeros(len(windows))
+    for column in range(window):
+        value = windows[:, column]
+        total = high + value
+        virtual = total - high
+        error = (high - (total - virtual)) + (value - virtual)
+        low += error
+        high = total + low
+        low -= high - total
+    # Only look for the inexact windows if the series as a whole spans too many orders of magnitude
+    magnitudes = np.abs(values[values != 0])
+    if len(magnitudes) == 0 or np.log2(magnitudes.max() / magnitudes.min()) <= MAX_EXACT_EXPONENT_SPAN:
+        return high
+    magnitudes = np.abs(windows)
+    smallest = np.where(magnitudes > 0, magnitudes, np.inf).min(axis=1)
+    largest = magnitudes.max(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inexact = np.flatnonzero((largest > 0) & (np.log2(largest / smallest) > MAX_EXACT_EXPONENT_SPAN))
+    for index in inexact:
+        high[index] = math.fsum(windows[index])
+    return high
+
+
+def with_non_finite(sums, values, window):
+    """
+    Overrides the sums of the windows that contain infinities or NaNs, like the builtin `sum`.
+
+    Args:
+        sums (numpy.ndarray): The sums of the windows without their non-finite values.
+        values (numpy.ndarray): The series, including the non-finite values.
+        window (int): The number of values per window.
+
+    Returns:
+        numpy.ndarray: The sums, inf, -inf or NaN where a window holds non-finite values.
+    """
+    def counts(mask):
+        cumulative = np.concatenate([[0], np.cumsum(mask)])
+        return cumulative[window:] - cumulative[:-window]
+
+    positive = counts(values == np.inf)
+    negative = counts(values == -np.inf)
+    nan = counts(np.isnan(values))
+    sums[positive > 0] = np.inf
+    sums[negative > 0] = -np.inf
+    sums[(nan > 0) | ((positive > 0) & (negative > 0))] = np.nan
+    return sums
+
+
+def analyze_run(resistance, config=None):
+    """
+    Runs the cure detection of CureSignalEngine over a whole recorded run at once.
+
+    The moving average, slopes and the lamp turn off, gelling point and saturation detection
+    are computed with array operations instead of one sample at a time, and give the same
+    results as feeding the samples through the streaming engine.
+
+    Args:
+        resistance (numpy.ndarray): The resistance column of the run.
+        config (CureConfig): The detection parameters, the defaults if None.
+
+    Returns:
+        dict: The detection flags and indices (as in Sensor_Data), plus the 'moving_average'
+        and 'slopes' arrays and the number of samples.
+    """
+    config = config if config is not None else CureConfig()
+    min_length = config.min_length_of_data
+    window = config.moving_average_window
+    delay = config.delay
+    slope_lag = config.slope_lag
+    n = len(resistance)
+    result = {
+        'sample_count': n,
+        'lamp_turn_off_flag': 0,
+        'lamp_turn_off_index': 0,
+        'two_mins_earlier_lamp_turn_off_index': 0,
+        'gel_point_flag': 0,
+        'geling_point_index': 0,
+        'saturation_flag': 0,
+        'saturation_index': 0,
+        'moving_average': np.empty(0),
+        'slopes': np.empty(0),
+    }
+    if n <= min_length:
+        return result
+
+    # The moving average of sample i (i >= min_length) is stored at i - min_length,
+    # the window is zero-padded like the engine's ring buffer
+    padded = np.concatenate([np.zeros(window - 1), resistance])
+    moving_average = window_sums(padded, window)[min_length:] / window
+    result['moving_average'] = moving_average
+    m = len(moving_average)
+    rising = np.zeros(m, dtype=bool)
+    rising[1:] = moving_average[1:] > moving_average[:-1]
+
+    # The checks start once more than `delay` averages exist
+    lamp = np.zeros(m, dtype=bool)
+    if m > delay:
+        lamp[delay:] = rising[delay:] & rising[1:m - delay + 1]
+    lamp_positions = np.flatnonzero(lamp)
+    lamp_position = int(lamp_positions[0]) if len(lamp_positions) else m
+
+    # The gelling point is tracked on the averages before the lamp turn off point
+    gel_end = lamp_position
+    if gel_end > delay:
+        gel_rising = rising[delay:gel_end]
+        starts = np.flatnonzero(gel_rising & ~np.concatenate([[False], gel_rising[:-1]]))
+        if len(starts):
+            result['geling_point_index'] = min_length + delay + int(starts[-1])
+        result['gel_point_flag'] = int(gel_rising[-1])
+
+    if lamp_position == m:
+        return result
+    lamp_index = min_length + lamp_position
+    result['lamp_turn_off_flag'] = 1
+    result['lamp_turn_off_index'] = lamp_index
+    result['two_mins_earlier_lamp_turn_off_index'] = lamp_index - delay
+
+    # After the lamp turn off point, the slopes are tracked until they decrease below the saturated slope
+    positions = np.arange(lamp_position, m)
+    # Like the engine's ring buffer, the averages before the first one read as zero
+    lagged = np.where(positions >= slope_lag, moving_average[np.maximum(positions - slope_lag, 0)], 0.0)
+    slopes = moving_average[positions] - lagged
+    result['slopes'] = slopes
+    decreasing = np.flatnonzero(slopes[2:] < slopes[1:-1])
+    if len(decreasing):
+        first_decreasing = int(decreasing[0]) + 2
+        saturated = np.flatnonzero(slopes[first_decreasing:] < config.saturation_slope)
+        if len(saturated):
+            result['saturation_flag'] = 1
+            result['saturation_index'] = lamp_index + first_decreasing + int(saturated[0])
+    return result
+
+
+def stream_run(resistance, config=None):
+    """
+    Feeds a recorded run through the streaming engine, one sample at a time.
+
+    Args:
+        resistance (numpy.ndarray): The resistance column of the run.
+        config (CureConfig): The detection parameters, the defaults if None.
+
+    Returns:
+        dict: The same keys as `analyze_run`.
+    """
+    engine = CureSignalEngine(config)
+    moving_average = []
+    slopes = []
+    for value in resistance.tolist():
+        average, slope = engine.update(value)
+        if average is not None:
+            moving_average.append(average)
+        if slope is not None:
+            slopes.append(slope)
+    return {
+        'sample_count': engine.sample_count,
+        'lamp_turn_off_flag': engine.lamp_turn_off_flag,
+        'lamp_turn_off_index': engine.lamp_turn_off_index,
+        'two_mins_earlier_lamp_turn_off_index': engine.two_mins_earlier_lamp_turn_off_index,
+        'gel_point_flag': engine.geling_point_flag,
+        'geling_point_index': engine.geling_point_index,
+        'saturation_flag': engine.saturation_flag,
+        'saturation_index': engine.saturation_index,
+        'moving_average': np.array(moving_average),
+        'slopes': np.array(slopes),
+    }
+
+
+def compare_results(vectorized, streamed):
+    """
+    Lists the differences between the vectorized and the streaming results of a run.
+
+    Args:
+        vectorized (dict): The result of `analyze_run`.
+        streamed (dict): The result of `stream_run`.
+
+    Returns:
+        list: The names of the keys that differ (empty if the results are identical).
+    """
+    differences = []
+    for key, value in vectorized.items():
+        other = streamed[key]
+        if isinstance(value, np.ndarray):
+            if not np.array_equal(value, other, equal_nan=True):
+                differences.append(key)
+        elif value != other:
+            differences.append(key)
+    return differences
+
+
+def check_non_finite_recovery():
+    """
+    Checks that a non-finite resistance only affects the windows that contain it.
+
+    A synthetic run with an inf and a NaN is fed through both engines: they must agree, and
+    the moving average must be finite again once the bad values have left the window.
+
+    Returns:
+        list: The failed checks (empty if the engines recover).
+    """
+    config = CureConfig()
+    window = config.moving_average_window
+    resistance = np.linspace(100.0, 400.0, 400)
+    resistance[80] = np.inf
+    resistance[150] = np.nan
+    failures = []
+    streamed = stream_run(resistance, config)
+    differences = compare_results(analyze_run(resistance, config), streamed)
+    if differences:
+        failures.append('engines differ: ' + ', '.join(differences))
+    # The moving average of sample i is stored at i - min_length
+    recovered = streamed['moving_average'][150 + window - config.min_length_of_data:]
+    if not np.isfinite(recovered).all():
+        failures.append('moving average stays non-finite')
+    return failures
+
+
+def find_runs(paths):
+    """
+    Lists the recorded runs in the given files and directories.
+
+    Args:
+        paths (list): Paths of runs or of directories searched recursively for runs.
+
+    Returns:
+        list: The sorted paths of the runs.
+    """
+    runs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, files in os.walk(path):
+                runs.extend(os.path.join(directory, name) for name in files if name.endswith(RUN_EXTENSIONS))
+        else:
+            runs.append(path)
+    return sorted(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-run the cure detection over recorded runs and report the detected events.")
+    parser.add_argument('paths', nargs='+', help="Recorded runs or directories of runs")
+    parser.add_argument('--verify', action='store_true',
+                        help="Also feed every run through the streaming engine and check the results are identical")
+    args = parser.parse_args()
+
+    columns = ('sample_count', 'geling_point_index', 'lamp_turn_off_index', 'saturation_index')
+    print('\t'.join(('run',) + columns + (('verified',) if args.verify else ())))
+    mismatches = 0
+    start = time.perf_counter()
+    for path in find_runs(args.paths):
+        resistance, _ = load_run(path)
+        result = analyze_run(resistance)
+        row = [path] + [str(result[column]) for column in columns]
+        if args.verify:
+            differences = compare_results(result, stream_run(resistance))
+            mismatches += bool(differences)
+            row.append('yes' if not differences else 'NO: ' + ', '.join(differences))
+        print('\t'.join(row))
+    print(f"Done in {time.perf_counter() - start:.2f} s")
+    if args.verify:
+        failures = check_non_finite_recovery()
+        print('Non-finite recovery: ' + ('yes' if not failures else 'NO: ' + '; '.join(failures)))
+        mismatches += bool(failures)
+    if mismatches:
+        raise SystemExit(f"{mismatches} runs differ between the vectorized and the streaming engine")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import threading
+import time
+
+import cv2
+
+from reanalyze import load_run
+
+
+REPLAY_BATCH_SIZE = 500  # Samples ingested at once when replaying as fast as possible
+SEEK_FRAMES = 50  # Jumps longer than this seek the video instead of grabbing every frame
+VIDEO_QUALITY = 90  # Default JPEG quality of the video frames
+
+
+def scale_image(frame, scale):
+    """
+    Scales a frame down.
+
+    Args:
+        frame (numpy.ndarray): The frame, or None.
+        scale (float): The scale, 1 returns the frame itself.
+
+    Returns:
+        numpy.ndarray: The scaled frame, or None without a frame.
+    """
+    if frame is None or scale == 1:
+        return frame
+    return cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+class ReplayClock:
+    """
+    The recording time shared by the sensor and video replays.
+
+    At a given speed the clock runs at `speed` times wall-clock time. Without a speed (as fast
+    as possible) it only moves when the sensor replay advances it, so the videos follow the
+    samples instead of the other way around.
+
+    Attributes:
+        speed (float): The replay speed (1 for real time), or None for as fast as possible.
+        start (float): The monotonic time the clock started at.
+        position (float): The recording time reached, for a clock without speed or once stopped.
+        stopped (bool): Set when the replay stops, freezes the clock and releases the waiters.
+        condition (threading.Condition): Signals position changes and stopping.
+
+    Methods:
+        now(): Returns the current recording time in seconds.
+        advance(position): Moves a clock without speed to a recording time.
+        wait_until(position): Blocks until the clock reaches a recording time.
+        stop(): Stops the clock and releases the waiters.
+    """
+
+    def __init__(self, speed=None):
+        self.speed = speed
+        self.start = time.monotonic()
+        self.position = 0.0
+        self.stopped = False
+        self.condition = threading.Condition()
+
+    def now(self):
+        """
+        Returns the current recording time.
+
+        Returns:
+            float: The recording time in seconds since the start of the replay.
+        """
+        if self.speed and not self.stopped:
+            return (time.monotonic() - self.start) * self.speed
+        return self.position
+
+    def advance(self, position):
+        """
+        Moves a clock without speed to a recording time.
+
+        Args:
+            position (float): The recording time in seconds.
+        """
+        with self.condition:
+            self.position = position
+            self.condition.notify_all()
+
+    def wait_until(self, position):
+        """
+        Blocks until the clock reaches a recording time.
+
+        Args:
+            position (float): The recording time in seconds.
+
+        Returns:
+            bool: True once the time is reached, False if the clock was stopped first.
+        """
+        with self.condition:
+            while not self.stopped:
+                remaining = position - self.now()
+                if remaining <= 0:
+                    return True
+                self.condition.wait(remaining / self.speed if self.speed else None)
+            return False
+
+    def stop(self):
+        """
+        Stops the clock and releases the waiters.
+        """
+        with self.condition:
+            if not self.stopped:
+                self.position = self.now()
+            self.stopped = True
+            self.condition.notify_all()
+
+
+class ReplayVideo:
+    """
+    A recorded video played back on a replay clock.
+
+    The video thread shows the frame matching the clock time: frames the clock skipped over
+    are grabbed without being decoded (or seeked over for long jumps), so the video never
+    drifts from the sensor replay whatever the speed. It has the same `sequence` and
+    `get_frame` interface as VideoCamera, so a FrameBroadcaster can serve it.
+
+    Attributes:
+        path (str): The path of the video file.
+        quality (int): The JPEG quality of the encoded frames.
+        video (cv2.VideoCapture): The video capture object, None until started.
+        fps (float): The frame rate of the video.
+        frame_count (int): The number of frames of the video.
+        position (int): The index of the current frame, -1 before the first one.
+        frame (numpy.ndarray): The current frame.
+        sequence (int): The number of frames shown so far, identifying `frame`.
+        encoded (bytes): The last encoded frame.
+        encoded_sequence (int): The sequence number of the frame `encoded` was made from.
+        lock (threading.Lock): Guards the encoded frame.
+        control_lock (threading.Lock): Serializes starting and stopping.
+        clock (ReplayClock): The clock the video follows.
+        thread (threading.Thread): The thread playing the video.
+
+    Methods:
+        start(clock): Plays the video from the beginning on a clock.
+        stop(): Stops playing, the last frame stays shown.
+        open(): Plays the video from the beginning in real time.
+        close(): Stops playing.
+        rewind(): Restarts the video from the beginning, if it is open.
+        play(): Shows the frame matching the clock time until the clock stops.
+        get_frame(): Encodes the current frame as a JPEG image and returns it.
+        get_image(scale): Returns the current frame scaled down.
+    """
+
+    def __init__(self, path, quality=VIDEO_QUALITY):
+        self.path = path
+        self.quality = quality
+        self.video = None
+        self.fps = 0
+        self.frame_count = 0
+        self.position = -1
+        self.frame = None
+        self.sequence = 0
+        self.encoded = None
+        self.encoded_sequence = 0
+        self.lock = threading.Lock()
+        self.control_lock = threading.Lock()
+        self.clock = None
+        self.thread = None
+
+    def start(self, clock):
+        """
+        Plays the video from the beginning on a clock.
+
+        Args:
+            clock (ReplayClock): The clock of the replay.
+        """
+        with self.control_lock:
+            self.stop_playing()
+            self.start_playing(clock)
+
+    def start_playing(self, clock):
+        """
+        Opens the video and starts the thread playing it, with `control_lock` held.
+        """
+        self.video = cv2.VideoCapture(self.path)
+        self.fps = self.video.get(cv2.CAP_PROP_FPS) or 1
+        self.frame_count = int(self.video.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.position = -1
+        self.clock = clock
+        self.thread = threading.Thread(target=self.play, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops playing, the last frame stays shown.
+        """
+        with self.control_lock:
+            self.stop_playing()
+
+    def stop_playing(self):
+        """
+        Stops the thread playing the video and releases it, with `control_lock` held.
+        """
+        if self.thread is not None:
+            self.clock.stop()
+            self.thread.join()
+            self.thread = None
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+    def open(self):
+        """
+        Plays the video from the beginning in real time, for a FrameBroadcaster opening it on demand.
+        """
+        self.start(ReplayClock(1))
+
+    def close(self):
+        """
+        Stops playing.
+        """
+        self.stop()
+
+    def rewind(self):
+        """
+        Restarts the video from the beginning in real time, if it is open.
+        """
+        with self.control_lock:
+            if self.thread is not None:
+                self.stop_playing()
+                self.start_playing(ReplayClock(1))
+
+    def play(self):
+        """
+        Shows the frame matching the clock time until the clock stops or the video ends.
+        """
+        video = self.video
+        while True:
+            target = int(self.clock.now() * self.fps)
+            if self.frame_count:
+                target = min(target, self.frame_count - 1)
+            if target > self.position:
+                if target - self.position > SEEK_FRAMES:
+                    video.set(cv2.CAP_PROP_POS_FRAMES, target)
+                    self.position = target - 1
+                # The skipped frames are grabbed but never decoded
+                while self.position < target - 1 and video.grab():
+                    self.position += 1
+                success, frame = video.read()
+                if not success:
+                    return
+                self.position += 1
+                # Convert the image from BGR color (which OpenCV uses) to RGB color
+                self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.sequence += 1
+            elif self.frame_count and self.position >= self.frame_count - 1:
+                return
+            if not self.clock.wait_until((self.position + 1) / self.fps):
+                return
+
+    def get_frame(self):
+        """
+        Encodes the current frame as a JPEG image and returns it.
+
+        The frame is only encoded once; later calls return the cached bytes until the
+        video moves to a new frame.
+
+        Returns:
+            bytes: The encoded frame as a JPEG image.
+        """
+        with self.lock:
+            sequence, frame = self.sequence, self.frame
+            if sequence != self.encoded_sequence and frame is not None:
+                encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+                self.encoded = cv2.imencode('.jpg', frame, encode_param)[1].tobytes()
+                self.encoded_sequence = sequence
+            return self.encoded
+
+    def get_image(self, scale=1.0):
+        """
+        Returns the current frame scaled down, for the reduced stream tiers.
+
+        Args:
+            scale (float): The scale, 1 returns the frame itself.
+
+        Returns:
+            numpy.ndarray: The scaled frame, or None before the first frame.
+        """
+        return scale_image(self.frame, scale)
+
+
+class Replay:
+    """
+    Replays a recorded run through the normal ingest path, with its videos on the same clock.
+
+    Sample i of the run is due at recording time i / frequency and is stamped with the replay
+    start time plus that offset, so the stored run has the timing of the recording whatever
+    the speed. At a given speed the samples due are ingested in one batch every time the clock
+    reaches the next one; as fast as possible, they are ingested in batches of
+    REPLAY_BATCH_SIZE and the clock (and the videos) follow.
+
+    Attributes:
+        path (str): The path of the recorded run.
+        speed (float): The replay speed (1 for real time), or None for as fast as possible.
+        frequency (float): The sensor rate of the recording in samples per second.
+        ingest (callable): Called with a list of (temperature, resistance, timestamp) samples.
+        videos (list): The ReplayVideo objects played along.
+        resistance (numpy.ndarray): The resistance column of the run.
+        temperature (numpy.ndarray): The temperature column of the run.
+        clock (ReplayClock): The shared recording time.
+        index (int): The number of samples ingested so far.
+        started (float): The replay start time in seconds since the epoch.
+        finished (bool): Set once every sample was ingested or the replay was stopped.
+        thread (threading.Thread): The thread replaying the samples.
+
+    Methods:
+        start(): Starts the replay.
+        stop(): Stops the replay.
+        run(): Ingests the samples as the clock reaches them.
+        get_status(): Returns the progress of the replay.
+    """
+
+    def __init__(self, path, speed, frequency, ingest, videos=()):
+        self.path = path
+        self.speed = speed
+        self.frequency = frequency
+        self.ingest = ingest
+        self.videos = list(videos)
+        self.resistance, self.temperature = load_run(path)
+        self.clock = ReplayClock(speed)
+        self.index = 0
+        self.started = None
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, args=())
+        self.thread.daemon = True
+
+    def start(self):
+        """
+        Starts the replay.
+        """
+        self.started = time.time()
+        for video in self.videos:
+            video.start(self.clock)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the replay, the videos keep their last frame.
+        """
+        self.clock.stop()
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+        for video in self.videos:
+            video.stop()
+
+    def run(self):
+        """
+        Ingests the samples as the clock reaches them.
+        """
+        n = len(self.resistance)
+        try:
+            while self.index < n:
+                if self.speed:
+                    if not self.clock.wait_until(self.index / self.frequency):
+                        return
+                    end = min(n, int(self.clock.now() * self.frequency) + 1)
+                else:
+                    if self.clock.stopped:
+                        return
+                    end = min(n, self.index + REPLAY_BATCH_SIZE)
+                self.ingest([(float(self.temperature[i]), float(self.resistance[i]),
+                              self.started + i / self.frequency) for i in range(self.index, end)])
+                self.index = end
+                if not self.speed:
+                    self.clock.advance((end - 1) / self.frequency)
+        finally:
+            self.finished = True
+
+    def get_status(self):
+        """
+        Returns the progress of the replay.
+
+        Returns:
+            dict: The path, speed, recording time reached, samples ingested and total, and
+            whether the replay finished.
+        """
+        return {
+            'path': self.path,
+            'speed': self.speed,
+            'position': self.clock.now(),
+            'sample_count': self.index,
+            'total_samples': len(self.resistance),
+            'finished': self.finished
+        }
@@ -0,0 +1,241 @@
+import itertools
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    sensor_id TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL,
+    sample_index INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    temperature REAL NOT NULL,
+    resistance REAL NOT NULL,
+    PRIMARY KEY (run_id, sample_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    run_id INTEGER NOT NULL,
+    sample_index INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    flag INTEGER NOT NULL,
+    timestamp REAL NOT NULL
+);
+"""
+
+INSERT_RUN = "INSERT INTO runs (run_id, sensor_id, started, config) VALUES (?, ?, ?, ?)"
+END_RUNS = "UPDATE runs SET ended = ? WHERE sensor_id = ? AND ended IS NULL AND run_id != ?"
+INSERT_SAMPLE = "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)"
+INSERT_EVENT = "INSERT INTO events VALUES (?, ?, ?, ?, ?)"
+
+_STOP = object()
+
+
+class RunLog:
+    """
+    An append-only on-disk log of the sensor samples and detection events of every run.
+
+    The log is an SQLite database in WAL mode. Appending only puts the row on a queue, so
+    ingest latency does not depend on the disk or on the size of the run. A background
+    thread writes the queued rows in batches, one transaction (and one fsync) per batch,
+    every `flush_interval` seconds or every `flush_size` rows, whichever comes first.
+
+    Attributes:
+        path (str): The path of the database file.
+        flush_interval (float): The longest time in seconds a row waits before being written.
+        flush_size (int): The number of rows that triggers a write before `flush_interval`.
+        queue (queue.SimpleQueue): The rows waiting to be written.
+        last_run_id (int): The last run ID handed out.
+        run_id_lock (threading.Lock): Guards `last_run_id`.
+        thread (threading.Thread): The thread writing the rows.
+
+    Methods:
+        start_run(sensor_id, timestamp, config): Starts a new run for a sensor and ends its previous one.
+        append_sample(run_id, index, timestamp, temperature, resistance): Logs a sample.
+        append_event(run_id, index, event, flag, timestamp): Logs a detection event.
+        open_runs(): Returns the runs that were never ended, by sensor ID.
+        read_samples(run_id): Returns the samples of a run in order.
+        read_config(run_id): Returns the detection parameters of a run.
+        close(): Writes the pending rows and stops the writer thread.
+    """
+
+    def __init__(self, path, flush_interval=1.0, flush_size=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.queue = queue.SimpleQueue()
+        connection = self.connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        # Logs written before the detection parameters were recorded lack the config column
+        if 'config' not in [column[1] for column in connection.execute("PRAGMA table_info(runs)")]:
+            connection.execute("ALTER TABLE runs ADD COLUMN config TEXT")
+        self.last_run_id = connection.execute("SELECT COALESCE(MAX(run_id), 0) FROM runs").fetchone()[0]
+        connection.close()
+        self.run_id_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.write_loop, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def connect(self):
+        """
+        Opens a connection to the database.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        connection = sqlite3.connect(self.path)
+        # With WAL, FULL syncs the log on every commit, i.e. once per batch
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def start_run(self, sensor_id, timestamp, config=None):
+        """
+        Starts a new run for a sensor and ends its previous one.
+
+        Args:
+            sensor_id (str): The ID of the sensor.
+            timestamp (float): The start time of the run in seconds since the epoch.
+            config (dict): The detection parameters of the run, or None.
+
+        Returns:
+            int: The ID of the new run.
+        """
+        with self.run_id_lock:
+            self.last_run_id += 1
+            run_id = self.last_run_id
+        self.queue.put((INSERT_RUN, (run_id, sensor_id, timestamp, json.dumps(config) if config else None)))
+        self.queue.put((END_RUNS, (timestamp, sensor_id, run_id)))
+        return run_id
+
+    def append_sample(self, run_id, index, timestamp, temperature, resistance):
+        """
+        Logs a sample.
+
+        Args:
+            run_id (int): The ID of the run.
+            index (int): The index of the sample in the run.
+            timestamp (float): The time of the sample in seconds since the epoch.
+            temperature (float): The temperature value.
+            resistance (float): The resistance value.
+        """
+        self.queue.put((INSERT_SAMPLE, (run_id, index, timestamp, temperature, resistance)))
+
+    def append_event(self, run_id, index, event, flag, timestamp):
+        """
+        Logs a detection event.
+
+        Args:
+            run_id (int): The ID of the run.
+            index (int): The sample index reported with the event.
+            event (str): The name of the event.
+            flag (int): The new value of the detection flag.
+            timestamp (float): The time of the sample that fired the event.
+        """
+        self.queue.put((INSERT_EVENT, (run_id, index, event, flag, timestamp)))
+
+    def open_runs(self):
+        """
+        Returns the runs that were never ended (the runs in progress when the API stopped).
+
+        Returns:
+            dict: The run ID of the open run of every sensor, by sensor ID.
+        """
+        connection = self.connect()
+        try:
+            rows = connection.execute(
+                "SELECT sensor_id, MAX(run_id) FROM runs WHERE ended IS NULL GROUP BY sensor_id").fetchall()
+        finally:
+            connection.close()
+        return dict(rows)
+
+    def read_samples(self, run_id):
+        """
+        Returns the samples of a run in order.
+
+        Args:
+            run_id (int): The ID of the run.
+
+        Returns:
+            list: The (timestamp, temperature, resistance) tuples of the run.
+        """
+        connection = self.connect()
+        try:
+            return connection.execute(
+                "SELECT timestamp, temperature, resistance FROM samples WHERE run_id = ? ORDER BY sample_index",
+                (run_id,)).fetchall()
+        finally:
+            connection.close()
+
+    def read_config(self, run_id):
+        """
+        Returns the detection parameters of a run.
+
+        Args:
+            run_id (int): The ID of the run.
+
+        Returns:
+            dict: The parameters by name, empty if the run did not record them.
+        """
+        connection = self.connect()
+        try:
+            row = connection.execute("SELECT config FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        finally:
+            connection.close()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def write_loop(self):
+        """
+        Writes the queued rows in batches until `close` is called.
+        """
+        connection = self.connect()
+        pending = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = self.flush_interval if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                row = self.queue.get(timeout=timeout)
+                if row is _STOP:
+                    stopping = True
+                else:
+                    pending.append(row)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+            if pending and (stopping or len(pending) >= self.flush_size or time.monotonic() >= deadline):
+                self.write_batch(connection, pending)
+                pending = []
+                deadline = None
+        connection.close()
+
+    def write_batch(self, connection, rows):
+        """
+        Writes a batch of rows in a single transaction.
+
+        Args:
+            connection (sqlite3.Connection): The connection of the writer thread.
+            rows (list): The (statement, parameters) tuples to write, in order.
+        """
+        try:
+            with connection:
+                for statement, group in itertools.groupby(rows, key=lambda row: row[0]):
+                    connection.executemany(statement, [parameters for _, parameters in group])
+        except sqlite3.Error as e:
+            print(f"Failed to write {len(rows)} rows to the run log: {e}")
+
+    def close(self):
+        """
+        Writes the pending rows and stops the writer thread.
+        """
+        self.queue.put(_STOP)
+        self.thread.join()
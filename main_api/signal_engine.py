@@ -0,0 +1,361 @@
+import math
+
+
+MIN_LENGTH_OF_DATA = 60
+MOVING_AVERAGE_WINDOW = 30
+DELAY_LAMP_TURN_OFF = 50 # Seconds
+FREQUENCY = 0.5  # per second
+SATURATION_SLOPE = 150  # Megaohm per minute
+MAX_WINDOW_SAMPLES = 86400  # Largest window, lamp turn off delay and slope lag in samples (a day at 1 Hz)
+
+
+class CureConfig:
+    """
+    The detection parameters of a run.
+
+    Attributes:
+        min_length_of_data (int): The number of samples before the moving average starts.
+        moving_average_window (int): The number of samples averaged by the moving average.
+        delay_lamp_turn_off (float): The time in seconds the rise must have lasted to turn off the lamp.
+        frequency (float): The sensor rate in samples per second.
+        saturation_slope (float): The slope below which the resistance is considered saturated.
+        delay (int): The lamp turn off delay in moving average values.
+        slope_lag (int): The number of moving average values a slope spans.
+
+    Methods:
+        to_dict(): Returns the parameters as a dictionary.
+        from_dict(values): Builds a configuration from a dictionary, missing parameters keep their default.
+    """
+
+    PARAMETERS = ('min_length_of_data', 'moving_average_window', 'delay_lamp_turn_off', 'frequency', 'saturation_slope')
+
+    def __init__(self, min_length_of_data=MIN_LENGTH_OF_DATA, moving_average_window=MOVING_AVERAGE_WINDOW,
+                 delay_lamp_turn_off=DELAY_LAMP_TURN_OFF, frequency=FREQUENCY, saturation_slope=SATURATION_SLOPE):
+        values = (min_length_of_data, moving_average_window, delay_lamp_turn_off, frequency, saturation_slope)
+        for name, value in zip(self.PARAMETERS, values):
+            if not math.isfinite(float(value)):
+                raise ValueError(f"{name} must be finite")
+        self.min_length_of_data = int(float(min_length_of_data))
+        self.moving_average_window = int(float(moving_average_window))
+        self.delay_lamp_turn_off = float(delay_lamp_turn_off)
+        self.frequency = float(frequency)
+        self.saturation_slope = float(saturation_slope)
+        # The engine allocates buffers of these sizes
+        for name, size in (('moving_average_window', self.moving_average_window),
+                           ('delay_lamp_turn_off*frequency', self.delay_lamp_turn_off*self.frequency),
+                           ('moving_average_window*frequency', self.frequency*self.moving_average_window)):
+            if size > MAX_WINDOW_SAMPLES:
+                raise ValueError(f"{name} must be at most {MAX_WINDOW_SAMPLES} samples")
+        self.delay = int(self.delay_lamp_turn_off*self.frequency)
+        self.slope_lag = int(self.frequency*self.moving_average_window)
+        if self.min_length_of_data < 0:
+            raise ValueError("min_length_of_data must not be negative")
+        if self.moving_average_window < 1:
+            raise ValueError("moving_average_window must be at least 1")
+        if self.delay < 1:
+            raise ValueError("delay_lamp_turn_off*frequency must be at least 1 sample")
+        if self.slope_lag < 1:
+            raise ValueError("moving_average_window*frequency must be at least 1 sample")
+
+    def to_dict(self):
+        """
+        Returns the parameters as a dictionary.
+
+        Returns:
+            dict: The parameters by name.
+        """
+        return {name: getattr(self, name) for name in self.PARAMETERS}
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        Builds a configuration from a dictionary, missing parameters keep their default.
+
+        Args:
+            values (dict): Parameters by name, unknown names are ignored.
+
+        Returns:
+            CureConfig: The configuration.
+
+        Raises:
+            ValueError: If a parameter is not a number or out of range.
+        """
+        return cls(**{name: values[name] for name in cls.PARAMETERS if name in values})
+
+    def __eq__(self, other):
+        return isinstance(other, CureConfig) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return 'CureConfig(' + ', '.join(f'{name}={value!r}' for name, value in self.to_dict().items()) + ')'
+
+
+class RingBuffer:
+    """
+    A fixed-size circular buffer of floats.
+
+    Appending overwrites the oldest value in place, so the buffer never allocates after
+    construction. Values are read newest first with negative indices, like the tail of a list.
+
+    Attributes:
+        size (int): The number of values the buffer holds.
+        values (list): The storage of the buffer, pre-filled with `fill`.
+        head (int): The position the next value is written to.
+
+    Methods:
+        append(value): Stores a value and returns the one it overwrote.
+        __getitem__(index): Returns a value by negative index (-1 is the newest).
+    """
+
+    __slots__ = ('size', 'values', 'head')
+
+    def __init__(self, size, fill=0.0):
+        self.size = size
+        self.values = [fill] * size
+        self.head = 0
+
+    def append(self, value):
+        """
+        Stores a value, overwriting the oldest one.
+
+        Args:
+            value (float): The value to store.
+
+        Returns:
+            float: The value that was overwritten.
+        """
+        evicted = self.values[self.head]
+        self.values[self.head] = value
+        self.head += 1
+        if self.head == self.size:
+            self.head = 0
+        return evicted
+
+    def __getitem__(self, index):
+        """
+        Returns a value by negative index.
+
+        Args:
+            index (int): The position from the newest value, between -1 and -size.
+
+        Returns:
+            float: The stored value.
+        """
+        if not -self.size <= index < 0:
+            raise IndexError('RingBuffer index out of range')
+        return self.values[(self.head + index) % self.size]
+
+
+class RollingSum:
+    """
+    An exact running sum that supports adding and removing values in constant time.
+
+    The sum is kept as a short list of non-overlapping partials (Shewchuk's algorithm, the
+    one behind `math.fsum`), so removing a value that left the window cancels it exactly and
+    no rounding error accumulates over a long cure.
+
+    Infinities and NaNs are only counted, never added to the partials (subtracting an infinity
+    would leave NaN behind for good). While any is in the sum it reads like the builtin `sum`
+    would (inf, -inf or NaN), and the sum recovers once they are removed.
+
+    Attributes:
+        partials (list): The non-overlapping partial sums of the finite values.
+        non_finite (list): The numbers of +inf, -inf and NaN values in the sum.
+
+    Methods:
+        add(value): Adds a value to the sum.
+        remove(value): Removes a value added before.
+        value(): Returns the correctly rounded sum.
+    """
+
+    __slots__ = ('partials', 'non_finite')
+
+    def __init__(self):
+        self.partials = []
+        self.non_finite = [0, 0, 0]
+
+    def add(self, value):
+        """
+        Adds a value to the sum.
+
+        Args:
+            value (float): The value to add.
+        """
+        if math.isfinite(value):
+            self.add_finite(value)
+        else:
+            self.non_finite[non_finite_kind(value)] += 1
+
+    def remove(self, value):
+        """
+        Removes a value added before.
+
+        Args:
+            value (float): The value to remove.
+        """
+        if math.isfinite(value):
+            self.add_finite(-value)
+        else:
+            self.non_finite[non_finite_kind(value)] -= 1
+
+    def add_finite(self, value):
+        """
+        Adds a finite value to the partials.
+
+        Args:
+            value (float): The value to add, negated to remove it.
+        """
+        partials = self.partials
+        i = 0
+        for partial in partials:
+            if abs(value) < abs(partial):
+                value, partial = partial, value
+            high = value + partial
+            low = partial - (high - value)
+            if low:
+                partials[i] = low
+                i += 1
+            value = high
+        partials[i:] = [value]
+
+    def value(self):
+        """
+        Returns the correctly rounded sum.
+
+        Returns:
+            float: The sum of every value added and not removed.
+        """
+        positive, negative, nan = self.non_finite
+        if nan or (positive and negative):
+            return math.nan
+        if positive:
+            return math.inf
+        if negative:
+            return -math.inf
+        return math.fsum(self.partials)
+
+
+def non_finite_kind(value):
+    """
+    Classifies a non-finite value.
+
+    Args:
+        value (float): An infinity or NaN.
+
+    Returns:
+        int: 0 for +inf, 1 for -inf, 2 for NaN.
+    """
+    if math.isnan(value):
+        return 2
+    return 0 if value > 0 else 1
+
+
+class CureSignalEngine:
+    """
+    Streaming cure detection over the resistance signal.
+
+    Every update runs in constant time: the moving average window and the short history of
+    averages the slope checks look back on live in ring buffers, so the engine never slices
+    or walks the stored history.
+
+    Attributes:
+        config (CureConfig): The detection parameters.
+        sample_count (int): The number of samples seen.
+        moving_average_count (int): The number of moving average values computed.
+        slope_count (int): The number of slopes computed after the lamp turn off point.
+        window (RingBuffer): The last `moving_average_window` resistance values.
+        window_sum (RollingSum): The sum of the values in `window`.
+        recent_averages (RingBuffer): The last moving average values the slope checks look back on.
+        last_slope (float): The last slope computed after the lamp turn off point.
+        lamp_turn_off_index (int): The index at which the lamp turns off.
+        lamp_turn_off_flag (int): A flag indicating whether the lamp has turned off.
+        geling_point_flag (int): A flag indicating whether the gelling point has been reached.
+        geling_point_index (int): The index at which the gelling point is reached.
+        two_mins_earlier_lamp_turn_off_index (int): The index at which the lamp turns off two minutes earlier.
+        slopes_decreaing_after_gelling_point_flag (int): A flag indicating whether the slopes are decreasing after the gelling point.
+        saturation_index (int): The index at which the resistance saturates.
+        saturation_flag (int): A flag indicating whether the resistance has saturated.
+
+    Methods:
+        update(resistance): Processes a new resistance value.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else CureConfig()
+        self.min_length_of_data = self.config.min_length_of_data
+        self.moving_average_window = self.config.moving_average_window
+        self.saturation_slope = self.config.saturation_slope
+        self.delay = self.config.delay
+        self.slope_lag = self.config.slope_lag
+        self.sample_count = 0
+        self.moving_average_count = 0
+        self.slope_count = 0
+        # The window starts zero-filled, which matches summing a shorter slice and dividing by the full window
+        self.window = RingBuffer(self.moving_average_window)
+        self.window_sum = RollingSum()
+        self.recent_averages = RingBuffer(max(self.delay, self.slope_lag) + 1)
+        self.last_slope = 0.0
+        self.lamp_turn_off_index = 0
+        self.lamp_turn_off_flag = 0
+        self.geling_point_flag = 0
+        self.geling_point_index = 0
+        self.two_mins_earlier_lamp_turn_off_index = 0
+        self.slopes_decreaing_after_gelling_point_flag = 0
+        self.saturation_index = 0
+        self.saturation_flag = 0
+
+    def update(self, resistance):
+        """
+        Processes a new resistance value.
+
+        Args:
+            resistance (float): The new resistance value.
+
+        Returns:
+            tuple: The moving average and the slope computed for this sample, each None if not computed yet.
+        """
+        index = self.sample_count
+        self.sample_count += 1
+        self.window_sum.add(resistance)
+        self.window_sum.remove(self.window.append(resistance))
+
+        # After min_length_of_data datapoints, we start calculating the moving average of resistance datahistory
+        if self.sample_count <= self.min_length_of_data:
+            return None, None
+        moving_average = self.window_sum.value() / self.moving_average_window
+        self.recent_averages.append(moving_average)
+        self.moving_average_count += 1
+        averages = self.recent_averages
+        delay = self.delay
+
+        # THE NOISE IS REMOVED USING MOVING AVERAGE
+        # IF THE SLOPE IS POSITIVE, AND IT WAS ALSO POSITIVE DELAY_LAMP_TURN_OFF DATA POINTS EARLIER,
+        # WE CONSIDER THAT THE GELING POINT HAS BEEN REACHED, SO WE SEND AN ALERT
+        if not self.lamp_turn_off_flag and self.moving_average_count > delay:
+            rising = averages[-1] > averages[-2]
+            if rising and averages[-delay] > averages[-delay-1]:
+                self.lamp_turn_off_index = index
+                self.two_mins_earlier_lamp_turn_off_index = index - delay
+                self.lamp_turn_off_flag = 1
+
+            ### WE WANT TO FIND THE GELING POINT SEPERATELY FOR VISUALIZATION PURPOSES ONLY
+            if not self.lamp_turn_off_flag:
+                if rising:
+                    if self.geling_point_flag == 0:
+                        self.geling_point_index = index
+                    self.geling_point_flag = 1
+                else:
+                    self.geling_point_flag = 0
+
+        # AFTER THE GELING POINT, WE TRACK THE SLOPES UNTIL THEY DECREASE BELOW THE SATURATED SLOPE (150 MEGAOHM PER MINUTE BY DEFAULT)
+        slope = None
+        if self.lamp_turn_off_flag:
+            slope = averages[-1] - averages[-self.slope_lag-1]
+            self.slope_count += 1
+            if self.slope_count > 2 and slope < self.last_slope:
+                self.slopes_decreaing_after_gelling_point_flag = 1
+            self.last_slope = slope
+            if self.slopes_decreaing_after_gelling_point_flag:
+                if slope < self.saturation_slope and not self.saturation_index:
+                    self.saturation_index = index
+                    self.saturation_flag = 1
+        return moving_average, slope
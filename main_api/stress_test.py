@@ -0,0 +1,238 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+SENSOR_IDS = ('stress-1', 'stress-2')
+WRITERS_PER_SENSOR = 3
+READERS_PER_SENSOR = 4
+BATCH_SIZE = 20  # Samples per /api/add_data_batch request, every other request is a single /api/add_data
+RESET_INTERVAL = 0.5  # Seconds between two resets of a sensor
+DURATION = 10.0  # Seconds the writers, readers and resets run
+MAX_REPORTED_ERRORS = 20
+SWITCH_INTERVAL = 1e-5  # Seconds between thread switches, far below the default so races show up quickly
+
+
+class Checker:
+    """
+    Collects the inconsistencies seen by the threads of the stress test.
+
+    Attributes:
+        errors (list): The inconsistencies, as messages.
+        checks (int): The number of responses checked.
+        lock (threading.Lock): Guards the attributes.
+
+    Methods:
+        check(condition, message): Records an inconsistency if a condition is false.
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.checks = 0
+        self.lock = threading.Lock()
+
+    def check(self, condition, message):
+        """
+        Records an inconsistency if a condition is false.
+
+        Args:
+            condition (bool): The expected invariant.
+            message (str): The description of the inconsistency.
+
+        Returns:
+            bool: The condition.
+        """
+        if not condition:
+            with self.lock:
+                self.errors.append(message)
+        return condition
+
+
+def check_series(checker, data, config, where):
+    """
+    Checks that the series of a get_data response are consistent with each other and with its cursor.
+
+    Every writer tags its samples with its number as the temperature and a counter as the
+    resistance, so the samples of one writer must also appear in increasing order.
+
+    Args:
+        checker (Checker): Collects the inconsistencies.
+        data (dict): The response of /api/get_data.
+        config (dict): The detection parameters of the sensor.
+        where (str): Describes the request, for the messages.
+    """
+    with checker.lock:
+        checker.checks += 1
+    count = data['next_index'] - data['since']
+    for name in ('stored_resistance', 'stored_temperature', 'stored_time'):
+        checker.check(len(data[name]) == count,
+                      f"{where}: {len(data[name])} {name} for since={data['since']}, next_index={data['next_index']}")
+    expected = max(0, data['next_index'] - max(data['since'], config['min_length_of_data']))
+    checker.check(len(data['moving_average_resistance']) == expected,
+                  f"{where}: {len(data['moving_average_resistance'])} moving averages, expected {expected}")
+    last = {}
+    for writer, value in zip(data['stored_temperature'], data['stored_resistance']):
+        if not checker.check(value > last.get(writer, -1),
+                             f"{where}: sample {value} of writer {writer} after {last.get(writer)}"):
+            break
+        last[writer] = value
+
+
+def write(api, sensor_id, writer, stop):
+    """
+    Posts tagged samples to a sensor, alternating single samples and batches.
+
+    Args:
+        api (module): The API module.
+        sensor_id (str): The sensor written to.
+        writer (int): The number of the writer, sent as the temperature.
+        stop (threading.Event): Set to stop writing.
+
+    Returns:
+        int: The number of samples posted.
+    """
+    client = api.app.test_client()
+    counter = 0
+    while not stop.is_set():
+        if counter % (2 * BATCH_SIZE):
+            client.post('/api/add_data', json={'sensor_id': sensor_id, 'temperature': writer, 'resistance': counter})
+            counter += 1
+        else:
+            samples = [{'temperature': writer, 'resistance': counter + i} for i in range(BATCH_SIZE)]
+            client.post('/api/add_data_batch', json={'sensor_id': sensor_id, 'samples': samples})
+            counter += BATCH_SIZE
+    return counter
+
+
+def read(api, sensor_id, checker, stop, retention):
+    """
+    Polls a sensor like the dashboard, checking every response and that the deltas follow each other.
+
+    Args:
+        api (module): The API module.
+        sensor_id (str): The sensor read.
+        checker (Checker): Collects the inconsistencies.
+        stop (threading.Event): Set to stop reading.
+        retention (bool): Whether old samples are dropped, so a delta may skip samples.
+
+    Returns:
+        int: The number of polls.
+    """
+    client = api.app.test_client()
+    config = api.sensors.get(sensor_id).config.to_dict()
+    generation = None
+    since = 0
+    polls = 0
+    while not stop.is_set():
+        query = f'/api/get_data?sensor_id={sensor_id}&since={since}'
+        if generation is not None:
+            query += f'&generation={generation}'
+        data = client.get(query).get_json()
+        check_series(checker, data, config, query)
+        if data['generation'] == generation:
+            # A delta of the same run starts where the previous response ended
+            checker.check(data['since'] == since or (retention and data['since'] > since),
+                          f"{query}: delta from {data['since']}")
+        elif generation is not None:
+            checker.check(data['generation'] > generation, f"{query}: generation went back to {data['generation']}")
+        generation, since = data['generation'], data['next_index']
+        history = client.get(f'/api/get_history?sensor_id={sensor_id}&points=100').get_json()
+        lengths = {len(history[name]) for name in ('stored_resistance', 'stored_temperature', 'stored_time')}
+        checker.check(len(lengths) == 1, f"get_history of {sensor_id}: series of lengths {sorted(lengths)}")
+        polls += 1
+    return polls
+
+
+def reset(api, sensor_id, stop):
+    """
+    Resets a sensor at a fixed interval.
+
+    Args:
+        api (module): The API module.
+        sensor_id (str): The sensor reset.
+        stop (threading.Event): Set to stop resetting.
+
+    Returns:
+        int: The number of resets.
+    """
+    client = api.app.test_client()
+    resets = 0
+    while not stop.wait(RESET_INTERVAL):
+        client.get(f'/api/reset_data?sensor_id={sensor_id}')
+        resets += 1
+    return resets
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stress the API with concurrent writers, readers and resets and check every response is consistent.")
+    parser.add_argument('--duration', type=float, default=DURATION, help="Seconds to run (default: %(default)s)")
+    parser.add_argument('--max-samples', type=int,
+                        help="Retention limit of the stressed sensors, to also stress dropping old samples")
+    args = parser.parse_args()
+
+    # Import the API from a scratch directory so its run log is a throwaway one
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix='stress-'))
+    import main as api
+    # No thermal analysis competing with the stress test
+    api.thermal_monitor.set_rate(0)
+
+    sys.setswitchinterval(SWITCH_INTERVAL)
+    checker = Checker()
+    stop = threading.Event()
+    tasks = []
+    for sensor_id in SENSOR_IDS:
+        api.sensors.get(sensor_id).max_samples = args.max_samples
+        tasks += [(f'{sensor_id} writer {writer}', write, (api, sensor_id, writer, stop))
+                  for writer in range(WRITERS_PER_SENSOR)]
+        tasks += [(f'{sensor_id} reader {reader}', read, (api, sensor_id, checker, stop, args.max_samples is not None))
+                  for reader in range(READERS_PER_SENSOR)]
+        tasks.append((f'{sensor_id} resets', reset, (api, sensor_id, stop)))
+    results = {}
+
+    def run(name, target, target_args):
+        results[name] = target(*target_args)
+
+    threads = [threading.Thread(target=run, args=task) for task in tasks]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # An exception ends a thread without a result
+    for name, _, _ in tasks:
+        checker.check(name in results, f"{name} died")
+    # Once the writers stopped, a final full read must match the pipeline exactly
+    client = api.app.test_client()
+    for sensor_id in SENSOR_IDS:
+        sensor_data = api.sensors.get(sensor_id)
+        data = client.get(f'/api/get_data?sensor_id={sensor_id}').get_json()
+        check_series(checker, data, sensor_data.config.to_dict(), f'final get_data of {sensor_id}')
+        checker.check(data['next_index'] == sensor_data.get_sample_count(),
+                      f"{sensor_id}: next_index {data['next_index']}, {sensor_data.get_sample_count()} samples")
+        checker.check(data['since'] == sensor_data.first_index,
+                      f"{sensor_id}: full read from {data['since']}, first index {sensor_data.first_index}")
+
+    def total(kind):
+        return sum(value for name, value in results.items() if kind in name)
+
+    samples = total('writer')
+    print(f"{samples} samples posted ({samples / elapsed:.0f}/s), {total('reader')} polls, "
+          f"{total('resets')} resets, {checker.checks} responses checked in {elapsed:.1f} s")
+    if checker.errors:
+        for message in checker.errors[:MAX_REPORTED_ERRORS]:
+            print(message)
+        raise SystemExit(f"{len(checker.errors)} inconsistencies found")
+    print("No inconsistencies found")
+
+
+if __name__ == '__main__':
+    main()
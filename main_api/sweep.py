@@ -0,0 +1,107 @@
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import os
+import sys
+import time
+
+from signal_engine import CureConfig, MIN_LENGTH_OF_DATA, MOVING_AVERAGE_WINDOW, DELAY_LAMP_TURN_OFF, FREQUENCY, SATURATION_SLOPE
+from reanalyze import load_run, analyze_run, find_runs
+
+
+EVENTS = (('gel_point', 'geling_point_index'), ('lamp_turn_off', 'lamp_turn_off_index'),
+          ('saturation', 'saturation_index'))
+
+
+def sweep_run(path, configs):
+    """
+    Runs the detection over one recorded run for every parameter combination.
+
+    Args:
+        path (str): The path of the recorded run.
+        configs (list): The CureConfig of every combination.
+
+    Returns:
+        list: One row per combination, the run and parameters followed by the time in seconds
+        from the start of the run of every detected event (None if not detected).
+    """
+    resistance, _ = load_run(path)
+    rows = []
+    for config in configs:
+        result = analyze_run(resistance, config)
+        row = {'run': path, **config.to_dict()}
+        for event, index in EVENTS:
+            # The indices are 0 until the event is detected
+            row[event + '_time'] = result[index] / config.frequency if result[index] else None
+        rows.append(row)
+    return rows
+
+
+def build_grid(args):
+    """
+    Builds the parameter combinations of the sweep.
+
+    Args:
+        args (argparse.Namespace): The parsed command line, one list of values per parameter.
+
+    Returns:
+        list: The CureConfig of every combination.
+
+    Raises:
+        ValueError: If a combination is invalid.
+    """
+    return [CureConfig(*values) for values in itertools.product(
+        args.min_length_of_data, args.moving_average_window, args.delay_lamp_turn_off, args.frequency,
+        args.saturation_slope)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Evaluate a grid of detection parameters over recorded runs in parallel.")
+    parser.add_argument('paths', nargs='+', help="Recorded runs or directories of runs")
+    parser.add_argument('--min-length-of-data', type=int, nargs='+', default=[MIN_LENGTH_OF_DATA])
+    parser.add_argument('--moving-average-window', type=int, nargs='+', default=[MOVING_AVERAGE_WINDOW])
+    parser.add_argument('--delay-lamp-turn-off', type=float, nargs='+', default=[DELAY_LAMP_TURN_OFF])
+    parser.add_argument('--frequency', type=float, nargs='+', default=[FREQUENCY])
+    parser.add_argument('--saturation-slope', type=float, nargs='+', default=[SATURATION_SLOPE])
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument('--output', help="Also write the table to this CSV file")
+    args = parser.parse_args()
+
+    try:
+        configs = build_grid(args)
+    except ValueError as e:
+        parser.error(f"Invalid parameter combination: {e}")
+    runs = find_runs(args.paths)
+    if not runs:
+        parser.error("No recorded runs found")
+
+    # Loading a run is the expensive part for small grids, so each task evaluates a chunk of the
+    # grid on one run; the grid is split so that every worker gets work even with a few runs
+    chunks = max(1, min(len(configs), -(-2 * args.workers // len(runs))))
+    chunk_size = -(-len(configs) // chunks)
+    tasks = [(path, configs[i:i + chunk_size]) for path in runs for i in range(0, len(configs), chunk_size)]
+
+    start = time.perf_counter()
+    rows = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(sweep_run, path, chunk) for path, chunk in tasks]
+        for future in futures:
+            rows.extend(future.result())
+
+    columns = ['run', *CureConfig.PARAMETERS, *(event + '_time' for event, _ in EVENTS)]
+    writer = csv.DictWriter(sys.stdout, columns, delimiter='\t', lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    if args.output:
+        with open(args.output, 'w', newline='') as file:
+            writer = csv.DictWriter(file, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    print(f"{len(configs)} combinations over {len(runs)} runs in {time.perf_counter() - start:.2f} s",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
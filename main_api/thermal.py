@@ -0,0 +1,358 @@
+import math
+import threading
+import time
+from array import array
+
+import cv2
+import numpy as np
+
+
+THERMAL_GRID = (4, 4)  # Rows and columns of regions the thermal image is split into
+# Thermal frames analyzed per second, 0 pauses the analysis. Off by default, since running
+# it keeps the thermal camera open; /api/thermal?rate= turns it on
+THERMAL_ANALYSIS_RATE = 0.0
+THERMAL_MIN_RATE = 0.01  # Lowest rate besides 0, frames per second
+THERMAL_MAX_RATE = 30.0  # Highest rate, frames per second (above the camera rate nothing new is analyzed)
+THERMAL_ANALYSIS_SCALE = 0.25  # Scale the frames are analyzed at, one of the stream scales
+THERMAL_MAX_AGE = 5.0  # Seconds after which an analysis no longer describes a sample
+# Calibration of the thermal palette: the temperatures of the darkest and brightest pixels,
+# None keeps the raw pixel intensity (0 to 255)
+THERMAL_TEMPERATURE_RANGE = None
+HOTSPOT_THRESHOLD = 200.0  # Value from which a pixel is part of a hotspot, in the units above
+HOTSPOT_MIN_AREA = 0.02  # Fraction of a region above the threshold that makes it a hotspot
+
+STATISTICS = ('max', 'mean', 'hotspot_area', 'rate')
+
+
+class ThermalAnalyzer:
+    """
+    Computes per-region statistics of thermal frames with NumPy.
+
+    The frame is converted to intensity (and to temperature if the palette is calibrated),
+    cropped to a multiple of the grid and reshaped to (rows, height, columns, width), so every
+    statistic of every region is a single reduction over two axes. The rate of change is the
+    change of each region mean per second since the previous frame analyzed.
+
+    Attributes:
+        grid (tuple): The number of region rows and columns.
+        hotspot_threshold (float): The value from which a pixel is part of a hotspot.
+        hotspot_min_area (float): The fraction of a region above the threshold that makes it a hotspot.
+        temperature_range (tuple): The temperatures of the darkest and brightest pixels, or None.
+        previous (tuple): The time and region means of the previous frame analyzed, or None.
+
+    Methods:
+        to_values(image): Converts a BGR or grayscale frame to intensities or temperatures.
+        analyze(image, timestamp): Computes the statistics of a frame.
+    """
+
+    def __init__(self, grid=THERMAL_GRID, hotspot_threshold=HOTSPOT_THRESHOLD,
+                 hotspot_min_area=HOTSPOT_MIN_AREA, temperature_range=THERMAL_TEMPERATURE_RANGE):
+        self.grid = tuple(grid)
+        self.hotspot_threshold = hotspot_threshold
+        self.hotspot_min_area = hotspot_min_area
+        self.temperature_range = temperature_range
+        self.previous = None
+
+    def to_values(self, image):
+        """
+        Converts a BGR or grayscale frame to intensities, or to temperatures if calibrated.
+
+        Args:
+            image (numpy.ndarray): The frame.
+
+        Returns:
+            numpy.ndarray: The values as float32, one per pixel.
+        """
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        values = image.astype(np.float32)
+        if self.temperature_range is not None:
+            low, high = self.temperature_range
+            values *= (high - low) / 255
+            values += low
+        return values
+
+    def analyze(self, image, timestamp):
+        """
+        Computes the statistics of every region of a frame.
+
+        Args:
+            image (numpy.ndarray): The frame.
+            timestamp (float): The time of the frame in seconds since the epoch.
+
+        Returns:
+            dict: The 'max', 'mean', 'hotspot_area' (fraction of the region) and 'rate' (change
+            of the mean per second, 0 for the first frame) arrays of shape `grid`, and the
+            boolean 'hotspots' array.
+        """
+        rows, columns = self.grid
+        values = self.to_values(image)
+        height, width = values.shape[0] // rows, values.shape[1] // columns
+        regions = values[:height * rows, :width * columns].reshape(rows, height, columns, width)
+        mean = regions.mean(axis=(1, 3))
+        hotspot_area = (regions >= self.hotspot_threshold).mean(axis=(1, 3))
+        if self.previous is not None and timestamp > self.previous[0]:
+            rate = (mean - self.previous[1]) / (timestamp - self.previous[0])
+        else:
+            rate = np.zeros_like(mean)
+        self.previous = (timestamp, mean)
+        return {
+            'max': regions.max(axis=(1, 3)),
+            'mean': mean,
+            'hotspot_area': hotspot_area,
+            'rate': rate,
+            'hotspots': hotspot_area >= self.hotspot_min_area,
+        }
+
+
+class ThermalSeries:
+    """
+    The time series of the thermal statistics, aligned on demand with the sensor samples.
+
+    The statistics are appended to flat columns (one value per region per analysis) before
+    the time column, so a reader that captures the length of the time column first always
+    finds complete analyses, without a lock, like DataSnapshot. A reset and the retention
+    limit swap in new columns through a single attribute, under a lock shared with `append`
+    so an analysis of the previous run never brings back its columns. Like the sensor
+    samples, the oldest analyses are dropped in chunks of a tenth of the limit.
+
+    Attributes:
+        grid (tuple): The number of region rows and columns.
+        max_analyses (int): The number of analyses kept in memory, or None to keep them all.
+        data (tuple): The time column (seconds since the epoch) and the columns of every
+            statistic in STATISTICS, by name.
+        hotspots (list): The [row, column] of the regions currently hotspots.
+        lock (threading.Lock): Serializes the writers (`append` and `reset`).
+
+    Methods:
+        reset(): Drops every analysis, for a new run.
+        append(timestamp, stats): Appends an analysis.
+        get_count(): Returns the number of analyses held.
+        get_latest(): Returns the last analysis.
+        align(timestamps, regions): Returns the statistics in force at every sample time.
+    """
+
+    def __init__(self, grid=THERMAL_GRID, max_analyses=None):
+        self.grid = tuple(grid)
+        self.max_analyses = max_analyses
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Drops every analysis, for a new run.
+        """
+        with self.lock:
+            self.data = (array('d'), {name: array('d') for name in STATISTICS})
+            self.hotspots = []
+
+    def append(self, timestamp, stats):
+        """
+        Appends an analysis.
+
+        The times never decrease (`align` searches them), so a frame time before the previous
+        analysis (a clock step back) is stored as that one.
+
+        Args:
+            timestamp (float): The time of the analyzed frame in seconds since the epoch.
+            stats (dict): The statistics returned by ThermalAnalyzer.analyze.
+        """
+        with self.lock:
+            times, columns = self.data
+            if times and timestamp < times[-1]:
+                timestamp = times[-1]
+            for name in STATISTICS:
+                columns[name].extend(stats[name].ravel().tolist())
+            times.append(timestamp)
+            self.hotspots = np.argwhere(stats['hotspots']).tolist()
+            if self.max_analyses is not None and \
+                    len(times) >= self.max_analyses + max(1, self.max_analyses // 10):
+                count = len(times) - self.max_analyses
+                size = self.grid[0] * self.grid[1]
+                self.data = (times[count:], {name: columns[name][count * size:] for name in STATISTICS})
+
+    def get_count(self):
+        """
+        Returns the number of analyses held.
+
+        Returns:
+            int: The number of analyses in memory, 0 after a reset or while the analysis never ran.
+        """
+        return len(self.data[0])
+
+    def get_latest(self):
+        """
+        Returns the last analysis.
+
+        Returns:
+            dict: The time, the current hotspots and the statistics of every region as nested
+            lists (rows of columns), or None before the first analysis.
+        """
+        times, columns = self.data
+        count = len(times)
+        if not count:
+            return None
+        size = self.grid[0] * self.grid[1]
+        latest = {'time': times[count - 1], 'hotspots': self.hotspots}
+        for name in STATISTICS:
+            latest[name] = np.frombuffer(columns[name][(count - 1) * size:count * size],
+                                         dtype=np.float64).reshape(self.grid).tolist()
+        return latest
+
+    def align(self, timestamps, regions=False):
+        """
+        Returns the statistics in force at every sample time (an as-of join).
+
+        Every sample gets the last analysis at or before its time, or None if there is none
+        within THERMAL_MAX_AGE seconds. Only the analyses between the first and the last one
+        referenced are copied, so a delta of a few samples stays cheap on a long run.
+
+        Args:
+            timestamps (array): The sample times in seconds since the epoch, in any order.
+            regions (bool): Also return the statistics of every region, not only of the whole frame.
+
+        Returns:
+            dict: The grid, the current hotspots and, for every statistic, one value per sample:
+            the highest region max, the mean of the region means, the mean hotspot area and the
+            highest rate of change. With `regions`, the per-region values of every sample as
+            flat lists (row by row), under 'regions'.
+        """
+        times, columns = self.data
+        count = len(times)
+        size = self.grid[0] * self.grid[1]
+        samples = np.frombuffer(timestamps, dtype=np.float64) if len(timestamps) else np.empty(0)
+        analysis_times = np.frombuffer(times[:count], dtype=np.float64) if count else np.empty(0)
+        positions = np.searchsorted(analysis_times, samples, side='right') - 1
+        valid = positions >= 0
+        valid[valid] = samples[valid] - analysis_times[positions[valid]] <= THERMAL_MAX_AGE
+        positions = positions[valid]
+        low, high = (int(positions.min()), int(positions.max()) + 1) if len(positions) else (0, 0)
+        result = {'grid': list(self.grid), 'hotspots': self.hotspots}
+        per_region = {}
+        for name, reduce in zip(STATISTICS, (np.max, np.mean, np.mean, np.max)):
+            values = np.frombuffer(columns[name][low * size:high * size], dtype=np.float64)
+            selected = values.reshape(high - low, size)[positions - low]
+            whole = np.full(len(samples), np.nan)
+            whole[valid] = reduce(selected, axis=1)
+            result[name] = [None if math.isnan(value) else value for value in whole.tolist()]
+            if regions:
+                rows = iter(selected.tolist())
+                per_region[name] = [next(rows) if ok else None for ok in valid.tolist()]
+        if regions:
+            result['regions'] = per_region
+        return result
+
+
+class ThermalMonitor:
+    """
+    Analyzes the frames of the thermal camera in the background at a configurable rate.
+
+    The analysis runs in its own thread on frames scaled down by the camera (cheaply for the
+    camera processes, which decode the JPEG frames reduced), so it never delays capture or the
+    streams. Every analysis is appended to the series, and the regions that become hotspots
+    are reported through `on_hotspot` as soon as they are seen.
+
+    Attributes:
+        camera (VideoCamera): The thermal camera, with the `sequence` and `get_image` interface.
+        analyzer (ThermalAnalyzer): Computes the statistics.
+        series (ThermalSeries): Stores the statistics.
+        rate (float): The number of frames analyzed per second, 0 pauses the analysis.
+        scale (float): The scale the frames are analyzed at.
+        on_start (callable): Called when the analysis starts or resumes (e.g. to open the camera).
+        on_stop (callable): Called when the analysis is paused.
+        on_hotspot (callable): Called with the new hotspot regions and the latest analysis.
+        analyses (int): The number of frames analyzed.
+        source (int): The camera sequence number of the last frame analyzed.
+        hotspots (set): The (row, column) of the regions currently hotspots.
+        wake (threading.Event): Set to apply a new rate immediately.
+        thread (threading.Thread): The thread analyzing the frames.
+
+    Methods:
+        set_rate(rate): Changes the analysis rate.
+        run(): Analyzes the new frames at the analysis rate.
+        analyze(): Analyzes the current frame, if it is new.
+    """
+
+    def __init__(self, camera, analyzer, series, rate=THERMAL_ANALYSIS_RATE, scale=THERMAL_ANALYSIS_SCALE,
+                 on_start=None, on_stop=None, on_hotspot=None):
+        self.camera = camera
+        self.analyzer = analyzer
+        self.series = series
+        self.rate = 0
+        self.scale = scale
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self.on_hotspot = on_hotspot
+        self.analyses = 0
+        self.source = 0
+        self.hotspots = set()
+        self.wake = threading.Event()
+        self.set_rate(rate)
+        self.thread = threading.Thread(target=self.run, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def set_rate(self, rate):
+        """
+        Changes the analysis rate.
+
+        Args:
+            rate (float): The number of frames analyzed per second, 0 pauses the analysis.
+
+        Raises:
+            ValueError: If the rate is neither 0 nor between THERMAL_MIN_RATE and THERMAL_MAX_RATE.
+        """
+        if not (rate == 0 or THERMAL_MIN_RATE <= rate <= THERMAL_MAX_RATE):
+            raise ValueError(f"the rate must be 0 or between {THERMAL_MIN_RATE} and {THERMAL_MAX_RATE}, got {rate}")
+        self.rate = rate
+        self.wake.set()
+
+    def run(self):
+        """
+        Analyzes the new frames at the analysis rate, pausing while the rate is 0.
+        """
+        running = False
+        while True:
+            rate = self.rate
+            if bool(rate) != running:
+                running = bool(rate)
+                callback = self.on_start if running else self.on_stop
+                try:
+                    if callback is not None:
+                        callback()
+                except Exception as e:
+                    print(f"Thermal analysis {'start' if running else 'stop'} failed: {e}")
+            if not running:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            start = time.monotonic()
+            try:
+                self.analyze()
+            except Exception as e:
+                print(f"Thermal analysis failed: {e}")
+            # Within the rate bounds whatever the rate, so the thread can neither spin nor die in wait
+            interval = min(max(1 / rate, 1 / THERMAL_MAX_RATE), 1 / THERMAL_MIN_RATE)
+            self.wake.wait(max(0.0, interval - (time.monotonic() - start)))
+            self.wake.clear()
+
+    def analyze(self):
+        """
+        Analyzes the current frame of the camera, if it was not analyzed already.
+        """
+        sequence = self.camera.sequence
+        if sequence == self.source:
+            return
+        image = self.camera.get_image(self.scale)
+        if image is None:
+            return
+        self.source = sequence
+        timestamp = time.time()
+        stats = self.analyzer.analyze(image, timestamp)
+        self.series.append(timestamp, stats)
+        self.analyses += 1
+        hotspots = set(map(tuple, np.argwhere(stats['hotspots']).tolist()))
+        new = sorted(hotspots - self.hotspots)
+        self.hotspots = hotspots
+        if new and self.on_hotspot is not None:
+            self.on_hotspot(new, stats)